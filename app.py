@@ -2,57 +2,250 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-from datetime import datetime
-import dateutil.parser
-import babel
 from flask import (
+    Blueprint,
     Flask, 
     render_template, 
     request, 
     flash, 
     redirect, 
     url_for,
-    abort
+    abort,
+    jsonify,
+    current_app,
+    stream_template,
+    stream_with_context
 )
 from flask_moment import Moment
+from datetime import date, datetime, time, timezone
+import click
+import os
 import logging
 from logging import Formatter, FileHandler
-from forms import *
-from flask_migrate import Migrate
-from models import db, Show, Artist, Venue
+from sqlalchemy.orm import noload, raiseload
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, Area, Show, Artist, Venue, refresh_show_counters, roll_over_shows
+from conditional import conditional
+from enums import Genre
+from export import EXPORTS, FORMATS as EXPORT_FORMATS, export_chunks
+from facets import GENRES, KINDS as FACET_KINDS, STATES, facets, seeking_column
+from formatting import format_datetime, format_datetimes
+from pagecache import page_cache
+from pagination import InvalidCursor, keyset_page
+from querybudget import QueryGuard, query_budget
+from routing import Replicas, use_primary, use_replica
+from queries import (
+    AREA_LISTING_KEYS,
+    VENUE_LISTING_KEYS,
+    area_listing,
+    area_venues_changed,
+    calendar_shows,
+    entity_fingerprint,
+    listing_batches,
+    listed_areas,
+    listing_fingerprint,
+    past_shows,
+    show_days,
+    upcoming_shows,
+    venue_areas
+)
+from search import search
+from telemetry import Telemetry, queued
+from typeahead import KINDS as TYPEAHEAD_KINDS, typeahead
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-migrate = Migrate(app, db)
-
-# TODO: connect to a local postgresql database
+moment = Moment()
+query_guard = QueryGuard()
+replicas = Replicas(db)
+telemetry = Telemetry()
+
+# Every route and command of the app; endpoints are named 'fyyur.<view>' and
+# commands run as `flask fyyur <command>`.
+fyyur = Blueprint('fyyur', __name__)
+
+def create_app(config='config'):
+  """Build the Fyyur app from `config`, an object or an import name.
+
+  Nothing here touches the database: the schema is created by
+  `flask fyyur create-db` (or `flask db upgrade`), and the typeahead
+  indexes are loaded on their first lookup. The form views import WTForms,
+  and the datetime filter Babel, on first use.
+  """
+  app = Flask(__name__)
+  app.config.from_object(config)
+  moment.init_app(app)
+  db.init_app(app)
+  replicas.init_app(app)
+  query_guard.init_app(app)
+  page_cache.init_app(app)
+  telemetry.init_app(app)
+  # Flask-Migrate pulls in Alembic, which only the `flask db` commands need,
+  # so workers started outside the flask command line skip it.
+  if click.get_current_context(silent=True) is not None:
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.register_blueprint(fyyur)
+  app.register_error_handler(404, not_found_error)
+  app.register_error_handler(500, server_error)
+
+  if not app.debug:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(queued(file_handler))
+    app.logger.info('errors')
+  return app
 
-with app.app_context():
-    db.create_all()
 #----------------------------------------------------------------------------#
-# Filters.
+# Controllers.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
-app.jinja_env.filters['datetime'] = format_datetime
+ARTIST_LISTING_KEYS = (Artist.name, Artist.id)
+SHOW_LISTING_KEYS = (Show.start_time, Show.venue_id, Show.artist_id)
+# Streamed pages are sent in chunks of about this many characters.
+STREAM_CHUNK_SIZE = 16 * 1024
+
+def page_args():
+  """Read the keyset pagination arguments of a listing request."""
+  limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+  limit = max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+  return {
+    'limit': limit,
+    'after': request.args.get('after'),
+    'before': request.args.get('before')
+  }
 
-#----------------------------------------------------------------------------#
-# Controllers.
-#----------------------------------------------------------------------------#
+def facet_selection():
+  """Read the facet filters of a listing request: ?state=, ?genre= (may be
+  repeated) and ?seeking=1 or 0."""
+  state = request.args.get('state') or None
+  genres = [genre for genre in request.args.getlist('genre') if genre]
+  seeking = request.args.get('seeking') or None
+  if (state is not None and state not in STATES) or any(genre not in GENRES for genre in genres) \
+      or seeking not in (None, '0', '1'):
+    abort(400)
+  return {'state': state, 'genres': genres, 'seeking': None if seeking is None else seeking == '1'}
+
+def facet_filter(model):
+  """The criteria of a listing's facet filters. Rows with any of the genres
+  are found with one bitwise test on the genres bitmask."""
+  selection = facet_selection()
+  criteria = []
+  if selection['state'] is not None:
+    criteria.append(model.state == selection['state'])
+  if selection['genres']:
+    criteria.append(model.genres.has_any(selection['genres']))
+  if selection['seeking'] is not None:
+    criteria.append(db.func.coalesce(seeking_column(model), False) == selection['seeking'])
+  return criteria
+
+def area_filter(model):
+  """The criteria of a listing's ?area= filter, an Area id. The
+  (area_id, name, id) listing indexes serve it."""
+  area = request.args.get('area')
+  if area is None:
+    return []
+  if not area.isdigit():
+    abort(400)
+  return [model.area_id == int(area)]
+
+def area_landing():
+  """Whether a /venues request is for the unfiltered landing page, which
+  lists areas rather than venues."""
+  return not area_filter(Venue) and not facet_filter(Venue)
+
+def facet_panel(kind):
+  """The facet counts shown next to a listing, under its filters."""
+  selection = facet_selection()
+  return {
+    'kind': kind,
+    'selection': selection,
+    'counts': facets.facets(kind, current_app.config['FACETS_MAX_AGE'], **selection),
+    'genre_labels': dict(Genre.choices()),
+    'seeking_label': 'Seeking talent' if kind == 'venues' else 'Seeking a venue'
+  }
 
-@app.route('/')
+def faceted_fingerprint(kind, select, keys):
+  """The validators of one listing page and of the facet counts beside it,
+  which change with rows on other pages too."""
+  validators = listing_fingerprint(select, keys, **page_args())
+  if validators is None:
+    return None
+  parts, lastModified = validators
+  return (parts, facets.digest(kind, current_app.config['FACETS_MAX_AGE'])), lastModified
+
+def detail_fingerprint(model, entityId):
+  """The validators of a venue or artist page, over the shows it lists."""
+  return entity_fingerprint(model, entityId, current_app.config['DETAIL_SHOWS_LIMIT'], request.args.get('past_after'))
+
+def calendar_range():
+  """Read the ?from= and ?to= dates (YYYY-MM-DD, both included) of a show
+  calendar request as a [start, end] datetime range, from the first
+  midnight to the last moment of ?to=, or None when there are none. ?to=
+  defaults to ?from=; longer than CALENDAR_MAX_DAYS is refused."""
+  first, last = request.args.get('from') or None, request.args.get('to') or None
+  if first is None and last is None:
+    return None
+  try:
+    first = date.fromisoformat(first)
+    last = first if last is None else date.fromisoformat(last)
+  except (TypeError, ValueError):
+    abort(400)
+  if not 0 <= (last - first).days < current_app.config['CALENDAR_MAX_DAYS']:
+    abort(400)
+  # Inclusive, as the day after 9999-12-31 does not exist.
+  return datetime.combine(first, time()), datetime.combine(last, time.max)
+
+def calendar_select():
+  """The shows of a calendar request: its date range, filtered by the
+  ?state= of the venue and the ?genre= (may be repeated) of the artist."""
+  start, end = calendar_range()
+  selection = facet_selection()
+  criteria = []
+  if selection['state'] is not None:
+    criteria.append(Venue.state == selection['state'])
+  if selection['genres']:
+    criteria.append(Artist.genres.has_any(selection['genres']))
+  return calendar_shows(start, end, criteria)
+
+def calendar_page():
+  """One page of a calendar request, grouped by day: (days, page)."""
+  page = keyset_page(db.session, calendar_select(), SHOW_LISTING_KEYS, **page_args())
+  return show_days(page), page
+
+def stream_requested():
+  """Whether a listing request asks for the whole listing, streamed."""
+  return current_app.config['LISTING_STREAM_ENABLED'] and request.args.get('all') == '1'
+
+def stream_page(template, **context):
+  """Render `template` into a streamed response.
+
+  The context may hold generators over listing_batches(); rows are then
+  fetched as the template reaches them, and the output is sent in chunks of
+  about STREAM_CHUNK_SIZE. Such responses are never stored by the page cache.
+  """
+  parts = stream_template(template, **context)
+  def chunks():
+    pending, size = [], 0
+    for part in parts:
+      pending.append(part)
+      size += len(part)
+      if size >= STREAM_CHUNK_SIZE:
+        yield ''.join(pending)
+        pending, size = [], 0
+    yield ''.join(pending)
+  return current_app.response_class(chunks(), mimetype='text/html')
+
+
+@fyyur.route('/')
+@query_budget(0)
 def index():
   return render_template('pages/home.html')
 
@@ -60,94 +253,80 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+def venues_fingerprint():
+  if area_landing():
+    return faceted_fingerprint(
+      'venues', listed_areas(Area.id, Area.venue_count, area_venues_changed()), AREA_LISTING_KEYS
+    )
+  return faceted_fingerprint(
+    'venues',
+    db.select(Venue.version, Venue.upcoming_shows_count).where(*facet_filter(Venue), *area_filter(Venue)),
+    VENUE_LISTING_KEYS
+  )
+
+@fyyur.route('/venues')
+@query_budget(4)  # one more when the worker (re)builds the facet counts
+@conditional(venues_fingerprint)
+@page_cache.cached('venues')
 def venues():
-  date = datetime.now()
-  lstVenue = Venue.query.all()
-  places = Venue.query.distinct(Venue.city, Venue.state)
-  data = []
-  for row in places:
-    findVenues = [venue for venue in lstVenue if venue.city == row.city and venue.state == row.state]
-    rsVenus = []
-    for v in findVenues:
-      upcomingShows = []
-      for show in v.shows:
-        if show.start_time > date:
-          upcomingShows.append(show)
-      rsVenus.append(
-        {
-          "id": v.id,
-          "name": v.name,
-          "num_upcoming_shows": len(upcomingShows)
-        }
-      )
-    data.append({
-      "city": row.city,
-      "state": row.state,
-      "venues": rsVenus
-    })
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+  try:
+    if area_landing():
+      data, page = area_listing(venues_per_area=current_app.config['AREA_VENUES_LIMIT'], **page_args())
+    else:
+      data, page = venue_areas(where=facet_filter(Venue) + area_filter(Venue), **page_args())
+  except InvalidCursor:
+    abort(400)
+  return render_template(
+    'pages/venues.html', areas=data, page=page, panel=facet_panel('venues'), landing=area_landing()
+  );
+
+@fyyur.route('/venues/search', methods=['POST'])
+@use_replica
+@query_budget(2)
 def search_venues():
-  date = datetime.now()
-  search = "%{}%".format(request.form.get("search_term", ""))
-  posts = Venue.query.filter(Venue.name.ilike(search)).all()
-  list = []
-  for row in posts:
-    upcomingShows = []
-    for show in row.shows:
-      if show.start_time > date:
-         upcomingShows.append(show)
-
-    list.append({
-      'id': row.id,
-      'name': row.name,
-      'num_upcoming_shows': len(upcomingShows)
-    })
-  response={
-    "count": len(list),
-    "data": list
-  }
+  response = search(Venue, request.form.get("search_term", ""), current_app.config['SEARCH_RESULT_LIMIT'])
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/venues/<int:venue_id>')
+@fyyur.route('/venues/<int:venue_id>')
+@query_budget(4)
+@conditional(lambda venue_id: detail_fingerprint(Venue, venue_id))
+@page_cache.cached(lambda venue_id: ['venue:{0}'.format(venue_id)])
 def show_venue(venue_id):
-  date = datetime.now()
-  venue = Venue.query.get_or_404(venue_id)
-  upcomingShows = []
-  pastShow = []
-  for show in venue.shows:
-    temp_show = {
-        'artist_id': show.artist_id,
-        'artist_name': show.artist.name,
-        'artist_image_link': show.artist.image_link,
-        'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-    }
-    if show.start_time > date:
-      upcomingShows.append(temp_show)
-    else :
-      pastShow.append(temp_show)
-  # object class to dict
+  venue = Venue.query.options(noload(Venue.shows)).get_or_404(venue_id)
+  limit = current_app.config['DETAIL_SHOWS_LIMIT']
+  upcomingShows = upcoming_shows(Venue, venue.id, limit)
+  try:
+    pastShows = past_shows(Venue, venue.id, limit, after=request.args.get('past_after'))
+  except InvalidCursor:
+    abort(400)
+  shows = upcomingShows + pastShows.items
+  startTimes = format_datetimes([show['start_time'] for show in shows], 'full')
+  for show, startTime in zip(shows, startTimes):
+    show['start_time'] = startTime
+    page_cache.add_tags('artist:{0}'.format(show['artist_id']))
+  # object class to dict, including the upcoming/past show counters
   data = vars(venue)
 
-  data['past_shows'] = pastShow
+  data['past_shows'] = pastShows.items
+  data['past_shows_next'] = pastShows.next_cursor
   data['upcoming_shows'] = upcomingShows
-  data['past_shows_count'] = len(pastShow)
-  data['upcoming_shows_count'] = len(upcomingShows)
   return render_template('pages/show_venue.html', venue=data)
   
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@fyyur.route('/venues/create', methods=['GET'])
+@query_budget(0)
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@fyyur.route('/venues/create', methods=['POST'])
+@query_budget(8)  # four of them keep SQLite's search index in step
 def create_venue_submission():
+  from forms import VenueForm
   form = VenueForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
@@ -166,6 +345,9 @@ def create_venue_submission():
       )
       db.session.add(venue)
       db.session.commit()
+      typeahead.add('venue', venue.id, venue.name)
+      facets.add('venues', facets.values(venue))
+      page_cache.invalidate('venues')
     except ValueError as e:
       print(e)
       # If there is any error, roll back it
@@ -184,15 +366,30 @@ def create_venue_submission():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@fyyur.route('/venues/<venue_id>', methods=['DELETE'])
+@query_budget(8)
 def delete_venue(venue_id):
   error = False
   try:
-      venue = Venue.query.filter_by(id=venue_id).first()
+      venue = Venue.query.options(noload(Venue.shows)).filter_by(id=venue_id).first()
       if venue is None:
         return render_template('errors/404.html')
+      # Drop the shows in one statement instead of cascading row by row,
+      # then recount the artists that played here.
+      artist_ids = db.session.scalars(
+        db.select(Show.artist_id).where(Show.venue_id == venue.id).distinct()
+      ).all()
+      db.session.execute(db.delete(Show).where(Show.venue_id == venue.id))
+      refresh_show_counters(Artist, artist_ids)
+      values = facets.values(venue)
       db.session.delete(venue)
       db.session.commit()
+      typeahead.remove('venue', venue.id)
+      facets.remove('venues', values)
+      page_cache.invalidate(
+        'venues', 'shows', 'venue:{0}'.format(venue.id),
+        *['artist:{0}'.format(artist_id) for artist_id in artist_ids]
+      )
       flash('Venue ' + venue.name + ' was successfully deleted!')
   except:
       db.session.rollback()
@@ -207,159 +404,219 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@fyyur.route('/artists')
+@query_budget(3)  # one more when the worker (re)builds the facet counts
+@conditional(lambda: None if stream_requested() else faceted_fingerprint(
+  'artists', db.select(Artist.version).where(*facet_filter(Artist), *area_filter(Artist)), ARTIST_LISTING_KEYS
+))
+@page_cache.cached('artists')
 def artists():
-  list = Artist.query.all()
+  select = db.select(Artist.id, Artist.name).where(*facet_filter(Artist), *area_filter(Artist))
+  if stream_requested():
+    rows = (
+      {'id': row.id, 'name': row.name}
+      for batch in listing_batches(select, ARTIST_LISTING_KEYS)
+      for row in batch
+    )
+    return stream_page('pages/artists.html', artists=rows, page=None, panel=facet_panel('artists'))
+  try:
+    page = keyset_page(db.session, select, ARTIST_LISTING_KEYS, **page_args())
+  except InvalidCursor:
+    abort(400)
   result = []
-  for row in list:
+  for row in page:
      result.append({'id': row.id, 'name': row.name})
-  return render_template('pages/artists.html', artists=result)
+  return render_template('pages/artists.html', artists=result, page=page, panel=facet_panel('artists'))
 
-@app.route('/artists/search', methods=['POST'])
+@fyyur.route('/artists/search', methods=['POST'])
+@use_replica
+@query_budget(2)
 def search_artists():
-  date = datetime.now()
-  search = "%{}%".format(request.form.get("search_term", ""))
-  posts = Artist.query.filter(Artist.name.ilike(search)).all()
-  list = []
-  for row in posts:
-    upcomingShows = []
-    for show in row.shows:
-      if show.start_time > date:
-         upcomingShows.append(show)
-
-    list.append({
-      'id': row.id,
-      'name': row.name,
-      'num_upcoming_shows': len(upcomingShows)
-    })
-  response={
-    "count": len(list),
-    "data": list
-  }
+  response = search(Artist, request.form.get("search_term", ""), current_app.config['SEARCH_RESULT_LIMIT'])
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+@fyyur.route('/artists/<int:artist_id>')
+@query_budget(4)
+@conditional(lambda artist_id: detail_fingerprint(Artist, artist_id))
+@page_cache.cached(lambda artist_id: ['artist:{0}'.format(artist_id)])
 def show_artist(artist_id):
-  date = datetime.now()
-  artist = Artist.query.get_or_404(artist_id)
-  upcomingShows = []
-  pastShow = []
-  for show in artist.shows:
-    temp_show = {
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M"),
-    }
-    if show.start_time > date:
-      upcomingShows.append(temp_show)
-    else :
-      pastShow.append(temp_show)
-  # object class to dict
+  artist = Artist.query.options(noload(Artist.shows)).get_or_404(artist_id)
+  limit = current_app.config['DETAIL_SHOWS_LIMIT']
+  upcomingShows = upcoming_shows(Artist, artist.id, limit)
+  try:
+    pastShows = past_shows(Artist, artist.id, limit, after=request.args.get('past_after'))
+  except InvalidCursor:
+    abort(400)
+  shows = upcomingShows + pastShows.items
+  startTimes = format_datetimes([show['start_time'] for show in shows], 'full')
+  for show, startTime in zip(shows, startTimes):
+    show['start_time'] = startTime
+    page_cache.add_tags('venue:{0}'.format(show['venue_id']))
+  # object class to dict, including the upcoming/past show counters
   data = vars(artist)
 
-  data['past_shows'] = pastShow
+  data['past_shows'] = pastShows.items
+  data['past_shows_next'] = pastShows.next_cursor
   data['upcoming_shows'] = upcomingShows
-  data['past_shows_count'] = len(pastShow)
-  data['upcoming_shows_count'] = len(upcomingShows)
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def artist_form_data(artist):
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website_link": artist.website_link,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link
+  }
+
+def venue_form_data(venue):
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website_link": venue.website_link,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link
+  }
+
+def commit_edit(entity):
+  """Commit an edit made against the version the form was loaded with.
+
+  Returns False, with nothing written, if the row changed in the meantime:
+  either the submitted version is already stale, or a concurrent edit
+  committed first (the ORM's versioned UPDATE then matches no row).
+  """
+  submitted = request.form.get('version', type=int)
+  if submitted is not None and submitted != entity.version:
+    db.session.rollback()
+    return False
+  try:
+    db.session.commit()
+  except StaleDataError:
+    db.session.rollback()
+    return False
+  return True
+
+EDIT_CONFLICT_MESSAGE = ('{0} was changed by someone else while you were editing it. '
+  'The form now shows the current values; reapply your changes and save again.')
+
+@fyyur.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@use_primary
+@query_budget(1)
 def edit_artist(artist_id):
-  findArtist = Artist.query.get_or_404(artist_id)
+  from forms import ArtistForm
+  findArtist = Artist.query.options(raiseload(Artist.shows)).get_or_404(artist_id)
   if findArtist is None:
     return abort(404)
   
-  artist={
-    "id": findArtist.id,
-    "name": findArtist.name,
-    "genres": findArtist.genres,
-    "city": findArtist.city,
-    "state": findArtist.state,
-    "phone": findArtist.phone,
-    "website_link": findArtist.website_link,
-    "facebook_link": findArtist.facebook_link,
-    "seeking_venue": findArtist.seeking_venue,
-    "seeking_description": findArtist.seeking_description,
-    "image_link": findArtist.image_link
-  }
+  artist = artist_form_data(findArtist)
   form = ArtistForm(formdata=None, data=artist)
-  return render_template('forms/edit_artist.html', form=form, artist=artist)
+  return render_template('forms/edit_artist.html', form=form, artist=artist, version=findArtist.version)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@fyyur.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@query_budget(8)
 def edit_artist_submission(artist_id):
-  artist = Artist.query.filter_by(id=artist_id).first()
+  from forms import ArtistForm
+  artist = Artist.query.options(raiseload(Artist.shows)).filter_by(id=artist_id).first()
   if artist is None:
     abort(404)
   form = ArtistForm(request.form)
   if form.validate():
+    before = facets.values(artist)
     form.populate_obj(artist)
 
-    db.session.commit()
-
-    return redirect(url_for("show_artist", artist_id=artist_id))
+    if not commit_edit(artist):
+      current = db.session.get(Artist, artist_id)
+      data = artist_form_data(current)
+      flash(EDIT_CONFLICT_MESSAGE.format('Artist ' + current.name), 'error')
+      form = ArtistForm(formdata=None, data=data)
+      return render_template('forms/edit_artist.html', form=form, artist=data, version=current.version), 409
+    typeahead.add('artist', artist.id, artist.name)
+    facets.change('artists', before, facets.values(artist))
+    page_cache.invalidate('artists', 'shows', 'artist:{0}'.format(artist.id))
+
+    return redirect(url_for('.show_artist', artist_id=artist_id))
   else:
     message = []
     for field, errors in form.errors.items():
         for error in errors:
             message.append(f"{field}: {error}")
     flash('Please fix the following errors: ' + ', '.join(message), 'error')
-    return render_template('forms/edit_artist.html', form=form, artist=artist)
+    return render_template('forms/edit_artist.html', form=form, artist=artist,
+      version=request.form.get('version', artist.version))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@fyyur.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@use_primary
+@query_budget(1)
 def edit_venue(venue_id):
-  findVenue = Venue.query.get_or_404(venue_id)
+  from forms import VenueForm
+  findVenue = Venue.query.options(raiseload(Venue.shows)).get_or_404(venue_id)
   if findVenue is None:
     return abort(404)
-  venue={
-    "id": findVenue.id,
-    "name": findVenue.name,
-    "genres": findVenue.genres,
-    "address": findVenue.address,
-    "city": findVenue.city,
-    "state": findVenue.state,
-    "phone": findVenue.phone,
-    "website_link": findVenue.website_link,
-    "facebook_link": findVenue.facebook_link,
-    "seeking_talent": findVenue.seeking_talent,
-    "seeking_description": findVenue.seeking_description,
-    "image_link": findVenue.image_link
-  }
+  venue = venue_form_data(findVenue)
   form = VenueForm(formdata=None, data=venue)
-  return render_template('forms/edit_venue.html', form=form, venue=venue)
+  return render_template('forms/edit_venue.html', form=form, venue=venue, version=findVenue.version)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@fyyur.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@query_budget(10)  # a move to another area also updates both area counts
 def edit_venue_submission(venue_id):
+  from forms import VenueForm
 
-  venue = Venue.query.get_or_404(venue_id)
+  venue = Venue.query.options(raiseload(Venue.shows)).get_or_404(venue_id)
   if venue is None:
     abort(404)
   form = VenueForm(request.form, meta={'csrf': False})
   if form.validate():
+    before = facets.values(venue)
     form.populate_obj(venue)
 
-    db.session.commit()
-
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    if not commit_edit(venue):
+      current = db.session.get(Venue, venue_id)
+      data = venue_form_data(current)
+      flash(EDIT_CONFLICT_MESSAGE.format('Venue ' + current.name), 'error')
+      form = VenueForm(formdata=None, data=data)
+      return render_template('forms/edit_venue.html', form=form, venue=data, version=current.version), 409
+    typeahead.add('venue', venue.id, venue.name)
+    facets.change('venues', before, facets.values(venue))
+    page_cache.invalidate('venues', 'shows', 'venue:{0}'.format(venue.id))
+
+    return redirect(url_for('.show_venue', venue_id=venue_id))
   else:
     message = []
     for field, errors in form.errors.items():
         for error in errors:
             message.append(f"{field}: {error}")
     flash('Please fix the following errors: ' + ', '.join(message), 'error')
-    return render_template('forms/edit_venue.html', form=form, venue=venue)
+    return render_template('forms/edit_venue.html', form=form, venue=venue,
+      version=request.form.get('version', venue.version))
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@fyyur.route('/artists/create', methods=['GET'])
+@query_budget(0)
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@fyyur.route('/artists/create', methods=['POST'])
+@query_budget(7)
 def create_artist_submission():
+  from forms import ArtistForm, VenueForm
   # called upon submitting the new artist listing form
   form = ArtistForm(request.form, meta={'csrf': False})
   if form.validate():
@@ -378,6 +635,9 @@ def create_artist_submission():
       )
       db.session.add(artist)
       db.session.commit()
+      typeahead.add('artist', artist.id, artist.name)
+      facets.add('artists', facets.values(artist))
+      page_cache.invalidate('artists')
     except ValueError as e:
         print(e)
         # If there is any error, roll back it
@@ -397,29 +657,90 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def shows_fingerprint():
+  if calendar_range() is not None:
+    return listing_fingerprint(
+      calendar_select().with_only_columns(Venue.version, Artist.version),
+      SHOW_LISTING_KEYS, **page_args()
+    )
+  if stream_requested():
+    return None
+  return listing_fingerprint(
+    db.select(Venue.version, Artist.version)
+    .join(Venue, Venue.id == Show.venue_id)
+    .join(Artist, Artist.id == Show.artist_id),
+    SHOW_LISTING_KEYS, **page_args()
+  )
+
+@fyyur.route('/shows')
+@query_budget(2)
+@conditional(shows_fingerprint)
+@page_cache.cached('shows')
 def shows():
-  lstShow = Show.query.all()
+  if calendar_range() is not None:
+    try:
+      days, page = calendar_page()
+    except InvalidCursor:
+      abort(400)
+    calendar = [
+      {'date': format_datetime(datetime.combine(day, time()), 'day'), 'shows': show_tiles(rows, 'time')}
+      for day, rows in days
+    ]
+    return render_template('pages/show_calendar.html', days=calendar, page=page, filters=calendar_filters())
+  select = (
+    db.select(
+      Show.venue_id,
+      Show.artist_id,
+      Show.start_time,
+      Venue.name.label('venue_name'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    )
+    .join(Venue, Venue.id == Show.venue_id)
+    .join(Artist, Artist.id == Show.artist_id)
+  )
+  if stream_requested():
+    tiles = (
+      tile for batch in listing_batches(select, SHOW_LISTING_KEYS)
+      for tile in show_tiles(batch)
+    )
+    return stream_page('pages/shows.html', shows=tiles, page=None, filters=calendar_filters())
+  try:
+    page = keyset_page(db.session, select, SHOW_LISTING_KEYS, **page_args())
+  except InvalidCursor:
+    abort(400)
+  return render_template('pages/shows.html', shows=show_tiles(page), page=page, filters=calendar_filters())
+
+def calendar_filters():
+  """The choices of the calendar form above the show listings."""
+  return {'states': STATES, 'genre_labels': Genre.choices()}
+
+def show_tiles(rows, format='full'):
   data = []
-  for show in lstShow:
+  startTimes = format_datetimes([show.start_time for show in rows], format)
+  for show, startTime in zip(rows, startTimes):
     data.append({
       "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
+      "venue_name": show.venue_name,
       "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M")
+      "artist_name": show.artist_name,
+      "artist_image_link": show.artist_image_link,
+      "start_time": startTime
     })
-  return render_template('pages/shows.html', shows=data)
+  return data
 
-@app.route('/shows/create')
+@fyyur.route('/shows/create')
+@query_budget(0)
 def create_shows():
+  from forms import ShowForm
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@fyyur.route('/shows/create', methods=['POST'])
+@query_budget(3)
 def create_show_submission():
+  from forms import ShowForm
   try:
     form = ShowForm(request.form)
     show = Show(
@@ -429,6 +750,11 @@ def create_show_submission():
     )
     db.session.add(show)
     db.session.commit()
+    page_cache.invalidate(
+      'shows', 'venues',
+      'venue:{0}'.format(int(form.venue_id.data)),
+      'artist:{0}'.format(int(form.artist_id.data))
+    )
     flash('Show: created successfully')
   except Exception as err:
     flash('An error occurred creating the Show. Error: {0}'.format(err))
@@ -437,36 +763,199 @@ def create_show_submission():
     db.session.close()
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+@fyyur.route('/api/shows/batch', methods=['POST'])
+@query_budget(4)
+def create_shows_batch():
+  # Creates many shows at once from a JSON list of ShowForm fields (or
+  # {"shows": [...]}), reporting the outcome of each one.
+  from importer import create_show_batch
+  payload = request.get_json(silent=True)
+  items = payload.get('shows') if isinstance(payload, dict) else payload
+  if not isinstance(items, list):
+    abort(400)
+  if len(items) > current_app.config['SHOW_BATCH_LIMIT']:
+    abort(413)
+  results, created = create_show_batch(items)
+  db.session.commit()
+  if created:
+    page_cache.invalidate('shows', 'venues', *set(
+      tag for show in created
+      for tag in ('venue:{0}'.format(show['venue_id']), 'artist:{0}'.format(show['artist_id']))
+    ))
+  return jsonify({'created': len(created), 'results': results})
+
+@fyyur.route('/api/shows/calendar')
+@query_budget(1)
+def show_calendar_api():
+  # The shows between ?from= and ?to= (dates, both included), optionally of
+  # one ?state= and ?genre=, grouped by day a page at a time.
+  if calendar_range() is None:
+    abort(400)
+  try:
+    days, page = calendar_page()
+  except InvalidCursor:
+    abort(400)
+  return jsonify({
+    'days': [
+      {
+        'date': day.isoformat(),
+        'shows': [dict(row._mapping, start_time=row.start_time.isoformat()) for row in rows]
+      }
+      for day, rows in days
+    ],
+    'next_cursor': page.next_cursor,
+    'prev_cursor': page.prev_cursor
+  })
+
+#  Export
+#  ----------------------------------------------------------------
+
+@fyyur.route('/api/export/<kind>')
+@query_budget(1)
+def export(kind):
+  # Streams every row (or those changed since ?since=) as NDJSON or CSV.
+  if kind not in EXPORTS:
+    abort(404)
+  format = request.args.get('format', 'ndjson')
+  if format not in EXPORT_FORMATS:
+    abort(400)
+  since = request.args.get('since')
+  if since is not None:
+    try:
+      since = datetime.fromisoformat(since)
+    except ValueError:
+      abort(400)
+    if since.tzinfo is not None:
+      since = since.astimezone(timezone.utc).replace(tzinfo=None)
+  gzip = 'gzip' in request.accept_encodings
+
+  response = current_app.response_class(
+    stream_with_context(export_chunks(kind, format, since, gzip)),
+    content_type=EXPORT_FORMATS[format]
+  )
+  response.headers['Content-Disposition'] = 'attachment; filename={0}.{1}'.format(kind, format)
+  response.vary.add('Accept-Encoding')
+  if gzip:
+    response.content_encoding = 'gzip'
+  return response
+
+#  Typeahead
+#  ----------------------------------------------------------------
+
+@fyyur.route('/api/typeahead')
+@query_budget(2)  # only when the worker (re)loads the indexes, one per kind
+def typeahead_api():
+  q = request.args.get('q', '')
+  limit = request.args.get('limit', current_app.config['TYPEAHEAD_LIMIT'], type=int)
+  limit = max(1, min(limit, current_app.config['TYPEAHEAD_MAX_LIMIT']))
+  kind = request.args.get('kind')
+  if kind is not None and kind not in TYPEAHEAD_KINDS:
+    abort(400)
+  results = []
+  for k in ([kind] if kind else TYPEAHEAD_KINDS):
+    results.extend(typeahead.complete(k, q, limit, current_app.config['TYPEAHEAD_MAX_AGE']))
+  return jsonify({'q': q, 'results': results[:limit]})
+
+#  Facets
+#  ----------------------------------------------------------------
+
+@fyyur.route('/api/facets/<kind>')
+@query_budget(1)  # when the worker (re)builds the counts
+def facets_api(kind):
+  # Counts per state, genre and seeking flag, each filtered by the other
+  # facets' ?state=, ?genre= and ?seeking= selections.
+  if kind not in FACET_KINDS:
+    abort(404)
+  selection = facet_selection()
+  counts = facets.facets(kind, current_app.config['FACETS_MAX_AGE'], **selection)
+  return jsonify(dict(counts, kind=kind, selection=selection))
+
+@fyyur.route('/api/cache/stats')
+def cache_stats():
+  return jsonify(page_cache.stats())
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@fyyur.cli.command('create-db')
+def create_db_command():
+  """Create any missing tables (use `flask db upgrade` on Postgres)."""
+  # Only on the primary; replicas get the schema through replication.
+  db.create_all(bind_key=None)
+  print('Created the database tables.')
+
+@fyyur.cli.command('rollover-shows')
+def rollover_shows_command():
+  """Move shows that have started from the upcoming to the past counters."""
+  # The workers' page caches live in their own processes; they show the new
+  # counts once their pages are older than PAGE_CACHE_TTL, at the latest.
+  updated = roll_over_shows()
+  print('Rolled over show counters for {0} venues and artists.'.format(updated))
+
+@fyyur.cli.command('telemetry-report')
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def telemetry_report_command(paths):
+  """Summarize request latency per route from the telemetry log.
+
+  Reads TELEMETRY_LOG and its rotated files unless PATHS are given.
+  """
+  from telemetry import read_records, summarize
+  if not paths:
+    log = current_app.config['TELEMETRY_LOG']
+    paths = [path for path in [log] + ['{0}.{1}'.format(log, i) for i in range(1, current_app.config['TELEMETRY_LOG_BACKUPS'] + 1)]
+             if os.path.exists(path)]
+  rows = summarize(read_records(paths))
+  print('{0:<6} {1:<34} {2:>7} {3:>9} {4:>9} {5:>9} {6:>6} {7:>8} {8:>8} {9:>9} {10:>6}'.format(
+    'method', 'route', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'sql', 'sql ms', 'tmpl ms', 'bytes', '5xx'
+  ))
+  for row in rows:
+    print('{method:<6} {route:<34} {count:>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {sql_count:>6.1f} '
+          '{sql_ms:>8.1f} {template_ms:>8.1f} {bytes:>9.0f} {errors:>6}'.format(**row))
+
+@fyyur.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per COPY/INSERT and commit.')
+@click.option('--method', type=click.Choice(['auto', 'copy', 'executemany']), default='auto', show_default=True)
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='Defaults to PATH.checkpoint.')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint.')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='Defaults to PATH.rejects.ndjson.')
+def import_command(kind, path, format, batch_size, method, checkpoint, restart, rejects):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file.
+
+  Rows are checked against the rules of the matching form, and loaded with
+  COPY on Postgres or batched INSERTs elsewhere. Rerun after a failure to
+  resume from the last committed batch.
+  """
+  from importer import run_import
+  checkpoint = checkpoint or path + '.checkpoint'
+  if restart and os.path.exists(checkpoint):
+    os.remove(checkpoint)
+  totals = run_import(
+    kind, path, format=format, batch_size=max(1, batch_size), method=method,
+    checkpoint=checkpoint, rejects=rejects or path + '.rejects.ndjson'
+  )
+  # As with rollover-shows, workers' cached pages age out after PAGE_CACHE_TTL.
+  print('Read {read} rows: {inserted} inserted, {existing} already present, {rejected} rejected.'.format(**totals))
+
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
-
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    create_app().run(host='0.0.0.0', port=3000, debug=True)
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,17 @@
+"""ASGI entry point: the asyncio read API under /api/v1, the Flask app for
+everything else.
+
+    uvicorn asgi:application --workers 4
+
+Flask views run on a pool of WSGI_THREADS threads per process.
+"""
+from a2wsgi import WSGIMiddleware
+
+from app import create_app
+from asyncapi import ReadAPI, mount
+
+flask_app = create_app()
+application = mount(
+    ReadAPI(flask_app.config),
+    WSGIMiddleware(flask_app, workers=flask_app.config['WSGI_THREADS'])
+)
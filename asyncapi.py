@@ -0,0 +1,236 @@
+"""JSON read API on asyncio, served next to the Flask app by asgi.py.
+
+A request waiting on the database holds no thread, so a single process can
+keep many lookups in flight. Queries use the models and select builders of
+the Flask app over an async driver: asyncpg on Postgres, aiosqlite on SQLite.
+The search backends and keyset pagination are synchronous and run through
+AsyncSession.run_sync(), which drives them on the async connection too.
+
+Routes, all GET:
+
+    /api/v1/venues/<id>         venue with its upcoming shows
+    /api/v1/artists/<id>        artist with its upcoming shows
+    /api/v1/venues/search?q=    same results as POST /venues/search
+    /api/v1/artists/search?q=
+    /api/v1/shows/upcoming      soonest shows first, ?limit= and ?after=
+"""
+from datetime import datetime
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+
+from sqlalchemy import func, inspect
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from models import db, Artist, Show, Venue
+from pagination import InvalidCursor, keyset_page
+from queries import show_listing
+from search import backend_for
+
+logger = logging.getLogger(__name__)
+
+PREFIX = '/api/v1'
+
+# Sync driver -> async driver of the same database.
+_ASYNC_DRIVERS = (
+    (re.compile(r'^postgres(ql)?(\+\w+)?://'), 'postgresql+asyncpg://'),
+    (re.compile(r'^sqlite(\+\w+)?://'), 'sqlite+aiosqlite://'),
+)
+
+
+def async_url(url):
+    """Swap the driver of a SQLAlchemy URL for its asyncio counterpart."""
+    for pattern, replacement in _ASYNC_DRIVERS:
+        if pattern.match(url):
+            return pattern.sub(replacement, url, count=1)
+    raise ValueError('No async driver for {0}'.format(url))
+
+
+def engine_options(config, url):
+    """Pool and timeout options for the async engine, from the app config."""
+    if not url.startswith('postgresql'):
+        # SQLite's dialect picks its own pool.
+        return {}
+    if config.get('DB_PGBOUNCER'):
+        # asyncpg's prepared statement cache does not survive transaction
+        # pooling.
+        return {'poolclass': NullPool, 'connect_args': {'statement_cache_size': 0}}
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    }
+    if config.get('DB_STATEMENT_TIMEOUT_MS'):
+        options['connect_args'] = {
+            'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}
+        }
+    return options
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class ReadAPI(object):
+    """ASGI app serving the read routes under PREFIX.
+
+    `config` is the Flask app's config, for the database URL, pool settings
+    and result limits. The engine is created on startup (or the first
+    request) and disposed of on shutdown.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.engine = None
+        self.sessions = None
+        self.routes = [
+            (re.compile(r'^/venues/search$'), self.search, Venue),
+            (re.compile(r'^/artists/search$'), self.search, Artist),
+            (re.compile(r'^/venues/(\d+)$'), self.detail, Venue),
+            (re.compile(r'^/artists/(\d+)$'), self.detail, Artist),
+            (re.compile(r'^/shows/upcoming$'), self.upcoming, None),
+        ]
+
+    def start(self):
+        if self.engine is None:
+            url = self.config.get('ASYNC_DATABASE_URL') or async_url(self.config['SQLALCHEMY_DATABASE_URI'])
+            self.engine = create_async_engine(url, **engine_options(self.config, url))
+            self.sessions = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def stop(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        status, body = await self.handle(scope)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('ascii')),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, scope):
+        path = scope['path'][len(PREFIX):] if scope['path'].startswith(PREFIX) else scope['path']
+        args = dict((key, values[0]) for key, values in parse_qs(scope['query_string'].decode('latin-1')).items())
+        try:
+            for pattern, view, model in self.routes:
+                match = pattern.match(path)
+                if match is None:
+                    continue
+                if scope['method'] != 'GET':
+                    raise HTTPError(405, 'method not allowed')
+                self.start()
+                async with self.sessions() as session:
+                    result = await view(session, model, args, *match.groups())
+                return 200, json.dumps(result, default=_json_default).encode('utf-8')
+            raise HTTPError(404, 'not found')
+        except HTTPError as e:
+            return e.status, json.dumps({'error': str(e)}).encode('utf-8')
+        except Exception:
+            logger.exception('Error serving %s', scope['path'])
+            return 500, json.dumps({'error': 'internal server error'}).encode('utf-8')
+
+    def _limit(self, args, default):
+        try:
+            limit = int(args.get('limit', default))
+        except ValueError:
+            raise HTTPError(400, 'limit must be a number')
+        return max(1, min(limit, self.config['MAX_PAGE_SIZE']))
+
+    async def detail(self, session, model, args, entity_id):
+        columns = [attr.key for attr in inspect(model).column_attrs]
+        row = (await session.execute(
+            db.select(*[getattr(model, column) for column in columns]).where(model.id == int(entity_id))
+        )).first()
+        if row is None:
+            raise HTTPError(404, 'not found')
+        select, keys = show_listing(model, int(entity_id))
+        shows = await session.execute(
+            select.where(Show.start_time > func.now()).order_by(*keys).limit(self.config['DETAIL_SHOWS_LIMIT'])
+        )
+        result = dict(zip(columns, row))
+        result['upcoming_shows'] = [dict(show._mapping) for show in shows]
+        return result
+
+    async def search(self, session, model, args):
+        term = args.get('q', '').strip()
+        limit = self.config['SEARCH_RESULT_LIMIT']
+        dialect = self.engine.dialect.name
+        results = await session.run_sync(lambda sync: backend_for(dialect).search(sync, model, term, limit))
+        # Keeps the SQLite FTS table if this search had to build it.
+        await session.commit()
+        return results
+
+    async def upcoming(self, session, model, args):
+        limit = self._limit(args, self.config['PAGE_SIZE'])
+        keys = (Show.start_time, Show.venue_id, Show.artist_id)
+        select = (
+            db.select(
+                Show.venue_id,
+                Venue.name.label('venue_name'),
+                Show.artist_id,
+                Artist.name.label('artist_name'),
+                Artist.image_link.label('artist_image_link'),
+                Show.start_time
+            )
+            .join(Venue, Venue.id == Show.venue_id)
+            .join(Artist, Artist.id == Show.artist_id)
+            .where(Show.start_time > func.now())
+        )
+        try:
+            page = await session.run_sync(
+                lambda sync: keyset_page(sync, select, keys, limit, after=args.get('after'))
+            )
+        except InvalidCursor:
+            raise HTTPError(400, 'invalid cursor')
+        return {
+            'shows': [dict(row._mapping) for row in page],
+            'next': page.next_cursor,
+        }
+
+
+def mount(api, wsgi):
+    """ASGI app sending PREFIX to `api` and every other request to `wsgi`,
+    the Flask app wrapped for ASGI."""
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan' or scope.get('path', '').startswith(PREFIX + '/'):
+            await api(scope, receive, send)
+        else:
+            await wsgi(scope, receive, send)
+
+    return application
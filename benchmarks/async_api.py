@@ -0,0 +1,174 @@
+"""Compare the requests per second of the async read API and the Flask routes.
+
+Starts one server process (uvicorn serving asgi:application, where Flask
+runs in a thread pool next to the asyncio API) and drives it with
+--concurrency keep-alive connections for --duration seconds per route.
+Each lookup is timed on its Flask route and on its /api/v1 counterpart:
+
+    DATABASE_URL=postgresql://... python benchmarks/async_api.py --concurrency 100
+
+The ids looked up are taken from /api/v1/shows/upcoming, so the database
+needs some upcoming shows. The page cache is turned off in the server so
+that both sides query the database on every request.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class Connection(object):
+    """A minimal HTTP/1.1 keep-alive client connection."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', content_type=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = '{0} {1} HTTP/1.1\r\nHost: {2}\r\nContent-Length: {3}\r\n'.format(method, path, self.host, len(body))
+        if content_type:
+            head += 'Content-Type: {0}\r\n'.format(content_type)
+        self.writer.write(head.encode('latin-1') + b'\r\n' + body)
+        status_line = await self.reader.readline()
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            data = b''
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                data += await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            data = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection') == 'close':
+            self.close()
+        return int(status_line.split()[1]), data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def load(host, port, requests, concurrency, duration):
+    """Send `requests` round-robin from `concurrency` connections for
+    `duration` seconds; return (completed, errors, latencies)."""
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+
+    async def worker(offset):
+        connection = Connection(host, port)
+        turn = offset
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body, content_type = requests[turn % len(requests)]
+                turn += 1
+                started = time.perf_counter()
+                status, _ = await connection.request(method, path, body, content_type)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[0] += 1
+        finally:
+            connection.close()
+
+    await asyncio.gather(*[worker(i) for i in range(concurrency)])
+    return len(latencies), errors[0], latencies
+
+
+def cases(venue_ids, artist_ids, term):
+    form = ('search_term=' + quote(term)).encode('ascii')
+    form_type = 'application/x-www-form-urlencoded'
+    return [
+        ('venue detail',
+         [('GET', '/venues/{0}'.format(i), b'', None) for i in venue_ids],
+         [('GET', '/api/v1/venues/{0}'.format(i), b'', None) for i in venue_ids]),
+        ('artist detail',
+         [('GET', '/artists/{0}'.format(i), b'', None) for i in artist_ids],
+         [('GET', '/api/v1/artists/{0}'.format(i), b'', None) for i in artist_ids]),
+        ('venue search',
+         [('POST', '/venues/search', form, form_type)],
+         [('GET', '/api/v1/venues/search?q=' + quote(term), b'', None)]),
+        ('upcoming shows',
+         [('GET', '/shows', b'', None)],
+         [('GET', '/api/v1/shows/upcoming', b'', None)]),
+    ]
+
+
+async def wait_until_up(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            connection = Connection(host, port)
+            status, body = await connection.request('GET', '/api/v1/shows/upcoming?limit=200')
+            connection.close()
+            return status, body
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run(args):
+    status, body = await wait_until_up(args.host, args.port)
+    if status != 200:
+        sys.exit('/api/v1/shows/upcoming answered {0}: {1}'.format(status, body[:200]))
+    shows = json.loads(body)['shows']
+    if not shows:
+        sys.exit('The database has no upcoming shows to look up.')
+    venue_ids = sorted(set(show['venue_id'] for show in shows))
+    artist_ids = sorted(set(show['artist_id'] for show in shows))
+
+    print('{0} connections, {1}s per route, one server process'.format(args.concurrency, args.duration))
+    print('{0:<16} {1:<7} {2:>9} {3:>9} {4:>9} {5:>7}'.format('lookup', 'server', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for name, flask_requests, async_requests in cases(venue_ids, artist_ids, args.term):
+        for server, requests in (('flask', flask_requests), ('async', async_requests)):
+            count, errors, latencies = await load(args.host, args.port, requests, args.concurrency, args.duration)
+            latencies.sort()
+            print('{0:<16} {1:<7} {2:>9.0f} {3:>9.1f} {4:>9.1f} {5:>7}'.format(
+                name, server, count / args.duration,
+                statistics.median(latencies) * 1000 if latencies else 0,
+                latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+                errors
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', default='asgi:application', help='ASGI app for uvicorn')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent connections')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per route')
+    parser.add_argument('--term', default='a', help='search term')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PAGE_CACHE_ENABLED='false')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', args.app, '--host', args.host, '--port', str(args.port),
+         '--log-level', 'warning', '--no-access-log'],
+        cwd=ROOT, env=env
+    )
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Fill the database with seeded synthetic venues, artists and shows.
+
+States are drawn in proportion to their population, cities within a state
+by a Zipf law over common US town names, and genres by rough popularity,
+all from the members of enums.State and enums.Genre. Shows favour popular
+venues and artists, and span the past year and the next six months. The
+same --seed always gives the same rows:
+
+    DATABASE_URL=postgresql://... python benchmarks/datagen.py --venues 1000 --artists 2000 --shows 20000
+
+Rows are added to whatever is in the database already.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from enums import Genre, State  # noqa: E402
+from models import db, Artist, Show, Venue, assign_areas, refresh_area_counts, refresh_show_counters  # noqa: E402
+from search import reindex  # noqa: E402
+from typeahead import typeahead  # noqa: E402
+
+# Population in millions (2020 census).
+STATE_POPULATION = {
+    'AL': 5.0, 'AK': 0.7, 'AZ': 7.2, 'AR': 3.0, 'CA': 39.5, 'CO': 5.8, 'CT': 3.6, 'DE': 1.0,
+    'DC': 0.7, 'FL': 21.5, 'GA': 10.7, 'HI': 1.5, 'ID': 1.8, 'IL': 12.8, 'IN': 6.8, 'IA': 3.2,
+    'KS': 2.9, 'KY': 4.5, 'LA': 4.7, 'ME': 1.4, 'MT': 1.1, 'NE': 2.0, 'NV': 3.1, 'NH': 1.4,
+    'NJ': 9.3, 'NM': 2.1, 'NY': 20.2, 'NC': 10.4, 'ND': 0.8, 'OH': 11.8, 'OK': 4.0, 'OR': 4.2,
+    'MD': 6.2, 'MA': 7.0, 'MI': 10.1, 'MN': 5.7, 'MS': 3.0, 'MO': 6.2, 'PA': 13.0, 'RI': 1.1,
+    'SC': 5.1, 'SD': 0.9, 'TN': 6.9, 'TX': 29.1, 'UT': 3.3, 'VT': 0.6, 'VA': 8.6, 'WA': 7.7,
+    'WV': 1.8, 'WI': 5.9, 'WY': 0.6,
+}
+
+# Relative popularity of each Genre member; the others count 1.
+GENRE_POPULARITY = {
+    'Rock_n_Roll': 10, 'Pop': 9, 'Hip_Hop': 8, 'Alternative': 6, 'Country': 6, 'Electronic': 6,
+    'Jazz': 5, 'RnB': 5, 'Blues': 4, 'Soul': 4, 'Folk': 4, 'Punk': 3, 'Heavy_Metal': 3,
+    'Reggae': 3, 'Funk': 3, 'Classical': 3, 'Instrumental': 2, 'Musical_Theatre': 2, 'Other': 2,
+}
+
+TOWNS = (
+    'Springfield', 'Franklin', 'Greenville', 'Bristol', 'Clinton', 'Fairview', 'Salem', 'Madison',
+    'Georgetown', 'Arlington', 'Ashland', 'Dover', 'Oxford', 'Jackson', 'Burlington', 'Manchester',
+    'Milton', 'Newport', 'Auburn', 'Dayton',
+)
+CITIES_PER_STATE = 12
+# Shows start within a year before and six months after now; their hour
+# offsets plus this are below 2 ** 16.
+SHOW_HOURS_OFFSET = 2 ** 15
+
+ADJECTIVES = (
+    'Blue', 'Golden', 'Velvet', 'Electric', 'Silver', 'Crimson', 'Lucky', 'Wild', 'Midnight',
+    'Neon', 'Rusty', 'Hollow', 'Bright', 'Lonely', 'Copper', 'Broken',
+)
+NOUNS = (
+    'Lantern', 'Owl', 'Anchor', 'Room', 'Tavern', 'Hall', 'Garden', 'Barn', 'Cellar', 'Harbor',
+    'Fox', 'River', 'Engine', 'Parade', 'Mirror', 'Horizon',
+)
+
+
+def _weighted_sample(rng, population, cum_weights, count):
+    """`count` distinct items of `population`, drawn by weight."""
+    chosen = []
+    while len(chosen) < count:
+        item = rng.choices(population, cum_weights=cum_weights)[0]
+        if item not in chosen:
+            chosen.append(item)
+    return chosen
+
+
+def _zipf_cum_weights(count, exponent=1.0):
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Generator(object):
+    """Seeded source of venue, artist and show rows."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.states = [state.value for state in State]
+        self.state_weights = list(itertools.accumulate(STATE_POPULATION.get(state.name, 1.0) for state in State))
+        self.cities = dict(
+            (state, self.rng.sample(TOWNS, CITIES_PER_STATE)) for state in self.states
+        )
+        self.city_weights = _zipf_cum_weights(CITIES_PER_STATE)
+        self.genres = [genre.name for genre in Genre]
+        self.genre_weights = list(itertools.accumulate(GENRE_POPULARITY.get(genre.name, 1) for genre in Genre))
+
+    def place(self):
+        state = self.rng.choices(self.states, cum_weights=self.state_weights)[0]
+        city = self.rng.choices(self.cities[state], cum_weights=self.city_weights)[0]
+        return city, state
+
+    def genre_list(self):
+        count = self.rng.choices((1, 2, 3), weights=(50, 35, 15))[0]
+        return _weighted_sample(self.rng, self.genres, self.genre_weights, count)
+
+    def phone(self):
+        return '{0}-555-{1:04d}'.format(self.rng.randint(201, 989), self.rng.randint(0, 9999))
+
+    def name(self, number):
+        return '{0} {1} {2}'.format(self.rng.choice(ADJECTIVES), self.rng.choice(NOUNS), number)
+
+    def venue(self, number):
+        city, state = self.place()
+        slug = 'venue{0}'.format(number)
+        return {
+            'name': 'The ' + self.name(number),
+            'city': city,
+            'state': state,
+            'address': '{0} {1} Street'.format(self.rng.randint(1, 9999), self.rng.choice(NOUNS)),
+            'phone': self.phone(),
+            'genres': self.genre_list(),
+            'image_link': 'https://images.example.com/{0}.jpg'.format(slug),
+            'facebook_link': 'https://www.facebook.com/{0}'.format(slug),
+            'website_link': 'https://{0}.example.com'.format(slug),
+            'seeking_talent': self.rng.random() < 0.3,
+            'seeking_description': None,
+        }
+
+    def artist(self, number):
+        city, state = self.place()
+        slug = 'artist{0}'.format(number)
+        return {
+            'name': self.name(number) + 's',
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'genres': self.genre_list(),
+            'image_link': 'https://images.example.com/{0}.jpg'.format(slug),
+            'facebook_link': 'https://www.facebook.com/{0}'.format(slug),
+            'website_link': 'https://{0}.example.com'.format(slug),
+            'seeking_venue': self.rng.random() < 0.3,
+            'seeking_description': None,
+        }
+
+    def shows(self, venue_ids, artist_ids, count, now=None):
+        """Yield `count` distinct shows; a few venues and artists get most."""
+        now = (now or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+        venue_ids = list(venue_ids)
+        artist_ids = list(artist_ids)
+        self.rng.shuffle(venue_ids)
+        self.rng.shuffle(artist_ids)
+        venue_weights = _zipf_cum_weights(len(venue_ids), 0.8)
+        artist_weights = _zipf_cum_weights(len(artist_ids), 0.8)
+        # Keys are packed into one int each, so that tens of millions fit.
+        seen = set()
+        while len(seen) < count:
+            artist_id = self.rng.choices(artist_ids, cum_weights=artist_weights)[0]
+            venue_id = self.rng.choices(venue_ids, cum_weights=venue_weights)[0]
+            hours = self.rng.randint(-365, 180) * 24 + self.rng.randint(-6, 5)
+            key = (artist_id << 48) | (venue_id << 16) | (hours + SHOW_HOURS_OFFSET)
+            if key not in seen:
+                seen.add(key)
+                yield {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': now + timedelta(hours=hours)}
+
+
+def _insert(model, rows, batch_size):
+    ids = []
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return ids
+        statement = db.insert(model)
+        if model is not Show:
+            statement = statement.returning(model.id)
+            ids.extend(db.session.scalars(statement, batch))
+        else:
+            db.session.execute(statement, batch)
+
+
+def generate(venues, artists, shows, seed=0, batch_size=5000):
+    """Add the generated rows and bring counters and search up to date.
+
+    Needs an app context. Returns the ids of the new venues and artists.
+    """
+    generator = Generator(seed)
+    venue_ids = _insert(Venue, (generator.venue(i) for i in range(1, venues + 1)), batch_size)
+    artist_ids = _insert(Artist, (generator.artist(i) for i in range(1, artists + 1)), batch_size)
+    if shows:
+        _insert(Show, generator.shows(venue_ids, artist_ids, shows), batch_size)
+    # The rows bypassed the mapper events that keep these current.
+    assign_areas(Venue)
+    assign_areas(Artist)
+    refresh_area_counts()
+    refresh_show_counters(Venue)
+    refresh_show_counters(Artist)
+    connection = db.session.connection()
+    reindex(connection, Venue)
+    reindex(connection, Artist)
+    db.session.commit()
+    typeahead.invalidate()
+    return venue_ids, artist_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=100)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    started = time.perf_counter()
+    with app.app_context():
+        generate(args.venues, args.artists, args.shows, args.seed)
+    print('Added {0} venues, {1} artists and {2} shows in {3:.1f}s.'.format(
+        args.venues, args.artists, args.shows, time.perf_counter() - started
+    ))
+
+
+if __name__ == '__main__':
+    main()
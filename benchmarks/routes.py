@@ -0,0 +1,308 @@
+"""Time every route of the app at several data scales and catch regressions.
+
+For each scale the database is emptied, filled by datagen.py, and every
+route (listings, detail pages, forms, the search POSTs, the JSON APIs and
+the write routes) is requested through the test client --repeat times. The
+median and p95 latency and the number of SQL statements of each route are
+printed, and compared with a baseline file when one is given:
+
+    python benchmarks/routes.py --scales small,medium --baseline baseline.json
+
+The first run writes the baseline; later runs exit with status 1 if a route
+issues more statements than it did then, or if its median latency grew by
+more than --tolerance (and by at least --min-slowdown ms). Latencies depend
+on the machine, so keep one baseline per machine, and pass --update-baseline
+to accept a change.
+
+THE DATABASE IS WIPED. By default a temporary SQLite file is used; pass
+--database-url to run against a scratch Postgres database, whose schema is
+rebuilt with the migrations.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telemetry import percentile  # noqa: E402
+
+SCALES = {
+    # name: (venues, artists, shows)
+    'small': (100, 200, 1000),
+    'medium': (1000, 2000, 20000),
+    'large': (10000, 20000, 200000),
+}
+
+# Venues set aside from the show data, for the DELETE route to remove.
+SPARE_VENUES = 50
+
+# Shows created by the write routes are dated from here on, one hour apart.
+SHOW_EPOCH = datetime(2031, 1, 1)
+
+
+def reset_schema(app, db):
+    """Drop and recreate every table of the primary database."""
+    if db.engine.dialect.name == 'sqlite':
+        from models import Artist, Venue
+        from search import SqliteSearch
+        with db.engine.begin() as connection:
+            for model in (Venue, Artist):
+                connection.exec_driver_sql('DROP TABLE IF EXISTS "{0}"'.format(SqliteSearch.fts_table(model)))
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+    else:
+        from flask_migrate import Migrate, downgrade, upgrade
+        Migrate(app, db)
+        downgrade(revision='base')
+        upgrade()
+
+
+def venue_form(number, genres):
+    return {
+        'name': 'Benchmark Venue {0}'.format(number),
+        'city': 'Springfield',
+        'state': 'IL',
+        'address': '{0} Main Street'.format(number),
+        'phone': '217-555-0100',
+        'genres': genres,
+        'image_link': 'https://images.example.com/benchmark.jpg',
+        'facebook_link': 'https://www.facebook.com/benchmark{0}'.format(number),
+        'website_link': 'https://benchmark.example.com',
+        'seeking_description': '',
+    }
+
+
+def artist_form(number, genres):
+    data = venue_form(number, genres)
+    del data['address']
+    data['name'] = 'Benchmark Artist {0}'.format(number)
+    return data
+
+
+def show_time(number):
+    return (SHOW_EPOCH + timedelta(hours=number)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def routes(venue_id, artist_id, area_id, spare_venue_ids, term):
+    """(name, method, path or path factory, body factory) of each route.
+
+    Factories take a request number, so that writes never collide.
+    """
+    genres = ['Jazz', 'Blues']
+    # Three days of the upcoming shows datagen.py spreads.
+    first = datetime.utcnow().date() + timedelta(days=7)
+    calendar = 'from={0}&to={1}'.format(first, first + timedelta(days=2))
+    return [
+        ('home', 'GET', '/', None),
+        ('venue listing', 'GET', '/venues', None),
+        ('artist listing', 'GET', '/artists', None),
+        ('show listing', 'GET', '/shows', None),
+        ('venues by genre', 'GET', '/venues?genre=Jazz&genre=Blues', None),
+        ('venues by area', 'GET', '/venues?area={0}'.format(area_id), None),
+        ('show calendar', 'GET', '/shows?' + calendar, None),
+        ('show calendar JSON', 'GET', '/api/shows/calendar?' + calendar, None),
+        ('artists by genre', 'GET', '/artists?genre=Jazz&genre=Blues', None),
+        ('venue detail', 'GET', '/venues/{0}'.format(venue_id), None),
+        ('artist detail', 'GET', '/artists/{0}'.format(artist_id), None),
+        ('venue form', 'GET', '/venues/create', None),
+        ('artist form', 'GET', '/artists/create', None),
+        ('show form', 'GET', '/shows/create', None),
+        ('venue edit form', 'GET', '/venues/{0}/edit'.format(venue_id), None),
+        ('artist edit form', 'GET', '/artists/{0}/edit'.format(artist_id), None),
+        ('typeahead', 'GET', '/api/typeahead?q=' + term, None),
+        ('venue facets', 'GET', '/api/facets/venues?state=CA&seeking=1', None),
+        ('artist facets', 'GET', '/api/facets/artists?genre=Jazz', None),
+        ('venue export', 'GET', '/api/export/venues', None),
+        ('artist export', 'GET', '/api/export/artists', None),
+        ('show export', 'GET', '/api/export/shows', None),
+        ('cache stats', 'GET', '/api/cache/stats', None),
+        ('venue search', 'POST', '/venues/search', lambda n: {'search_term': term}),
+        ('artist search', 'POST', '/artists/search', lambda n: {'search_term': term}),
+        ('create venue', 'POST', '/venues/create', lambda n: venue_form(n, genres)),
+        ('create artist', 'POST', '/artists/create', lambda n: artist_form(n, genres)),
+        ('create show', 'POST', '/shows/create', lambda n: {
+            'artist_id': artist_id, 'venue_id': venue_id, 'start_time': show_time(n),
+        }),
+        ('edit venue', 'POST', '/venues/{0}/edit'.format(venue_id), lambda n: venue_form(n, genres)),
+        ('edit artist', 'POST', '/artists/{0}/edit'.format(artist_id), lambda n: artist_form(n, genres)),
+        ('show batch', 'POST', '/api/shows/batch', lambda n: [
+            {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': show_time(-n * 10 - i - 1)}
+            for i in range(10)
+        ]),
+        ('delete venue', 'DELETE', lambda n: '/venues/{0}'.format(spare_venue_ids[n]), None),
+    ]
+
+
+def measure(client, counter, route, repeat, warmup, serial):
+    name, method, path, body = route
+    latencies, statements, statuses = [], 0, set()
+    for turn in range(warmup + repeat):
+        number = next(serial)
+        url = path(number) if callable(path) else path
+        kwargs = {}
+        if body is not None:
+            data = body(number)
+            kwargs['json' if isinstance(data, list) else 'data'] = data
+        counter[0] = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        response.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        statuses.add(response.status_code)
+        if turn >= warmup:
+            latencies.append(elapsed)
+            statements = max(statements, counter[0])
+    latencies.sort()
+    return {
+        'median_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'statements': statements,
+        'status': sorted(statuses),
+    }
+
+
+def run_scale(app, db, scale, args, counter):
+    import datagen
+    from models import Area, Show
+
+    venues, artists, shows = SCALES[scale]
+    with app.app_context():
+        reset_schema(app, db)
+        started = time.perf_counter()
+        datagen.generate(venues, artists, shows, seed=args.seed)
+        spare_ids, _ = datagen.generate(SPARE_VENUES, 0, 0, seed=args.seed + 1)
+        generated = time.perf_counter() - started
+        # The busiest venue and artist make the heaviest detail pages.
+        venue_id = db.session.scalar(
+            db.select(Show.venue_id).group_by(Show.venue_id).order_by(db.func.count().desc()).limit(1)
+        )
+        artist_id = db.session.scalar(
+            db.select(Show.artist_id).group_by(Show.artist_id).order_by(db.func.count().desc()).limit(1)
+        )
+        area_id = db.session.scalar(db.select(Area.id).order_by(Area.venue_count.desc()).limit(1))
+        db.session.remove()
+    print('\n{0}: {1} venues, {2} artists, {3} shows (generated in {4:.1f}s)'.format(
+        scale, venues, artists, shows, generated
+    ))
+
+    serial = itertools.count()
+    delete_serial = iter(range(SPARE_VENUES))
+    client = app.test_client()
+    results = {}
+    print('{0:<18} {1:>10} {2:>10} {3:>6} {4:>8}'.format('route', 'median ms', 'p95 ms', 'sql', 'status'))
+    for route in routes(venue_id, artist_id, area_id, spare_ids, args.term):
+        result = measure(
+            client, counter, route, args.repeat, args.warmup,
+            delete_serial if route[1] == 'DELETE' else serial
+        )
+        results[route[0]] = result
+        print('{0:<18} {1:>10.1f} {2:>10.1f} {3:>6} {4:>8}'.format(
+            route[0], result['median_ms'], result['p95_ms'], result['statements'],
+            ','.join(str(status) for status in result['status'])
+        ))
+    return results
+
+
+def regressions(results, baseline, tolerance, min_slowdown):
+    """Describe each route that got slower or issues more statements than
+    in `baseline`."""
+    found = []
+    for scale, routes_ in sorted(results.items()):
+        for name, result in sorted(routes_.items()):
+            before = baseline.get(scale, {}).get(name)
+            if before is None:
+                continue
+            if result['statements'] > before['statements']:
+                found.append('{0} / {1}: {2} SQL statements, was {3}'.format(
+                    scale, name, result['statements'], before['statements']
+                ))
+            slower = result['median_ms'] - before['median_ms']
+            if result['median_ms'] > before['median_ms'] * (1 + tolerance) and slower >= min_slowdown:
+                found.append('{0} / {1}: median {2:.1f} ms, was {3:.1f} ms'.format(
+                    scale, name, result['median_ms'], before['median_ms']
+                ))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database to wipe and fill (default: a temporary SQLite file)')
+    parser.add_argument('--scales', default='small,medium', help='comma-separated, from: ' + ', '.join(SCALES))
+    parser.add_argument('--repeat', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per route first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--term', default='a', help='search and typeahead term')
+    parser.add_argument('--baseline', help='JSON file of earlier results to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='overwrite the baseline with these results')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative growth of the median')
+    parser.add_argument('--min-slowdown', type=float, default=2.0, help='ms a median must grow by to fail')
+    args = parser.parse_args()
+
+    if args.warmup + args.repeat > SPARE_VENUES:
+        parser.error('--warmup plus --repeat may be at most {0}'.format(SPARE_VENUES))
+    scales = [scale.strip() for scale in args.scales.split(',') if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error('unknown scale: ' + ', '.join(unknown))
+
+    scratch = None
+    if args.database_url is None:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        scratch.close()
+        args.database_url = 'sqlite:///' + scratch.name
+    # Read by config.py, so set before the app is imported: every request
+    # hits the database, and nothing else is measured or logged.
+    os.environ.update({
+        'DATABASE_URL': args.database_url,
+        'PAGE_CACHE_ENABLED': 'false',
+        'TELEMETRY_ENABLED': 'false',
+        'QUERY_BUDGET_MODE': 'off',
+    })
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    counter = [0]
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    try:
+        results = dict((scale, run_scale(app, db, scale, args, counter)) for scale in scales)
+    finally:
+        if scratch is not None:
+            os.unlink(scratch.name)
+
+    if args.baseline is None:
+        return
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('\nWrote the baseline to {0}.'.format(args.baseline))
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    found = regressions(results, baseline, args.tolerance, args.min_slowdown)
+    if found:
+        print('\nRegressions against {0}:'.format(args.baseline))
+        for line in found:
+            print('  ' + line)
+        sys.exit(1)
+    print('\nNo regressions against {0}.'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
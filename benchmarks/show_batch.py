@@ -0,0 +1,82 @@
+"""Compare show insert throughput of the form and batch endpoints.
+
+Creates a scratch venue and artist in the database of the app's config
+(DATABASE_URL), then adds --shows shows to them twice: once through
+POST /shows/create, one request per show, and once through
+POST /api/shows/batch, --batch-size shows per request. Prints the rate of
+each path, then deletes the scratch rows again:
+
+    DATABASE_URL=postgresql://... python benchmarks/show_batch.py --shows 2000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app  # noqa: E402
+from models import db, Artist, Show, Venue, refresh_area_counts  # noqa: E402
+
+
+def start_times(first, count):
+    base = datetime(2100, 1, 1)
+    return [(base + timedelta(minutes=first + i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=1000, help='shows to add through each path')
+    parser.add_argument('--batch-size', type=int, default=None, help='shows per batch request (SHOW_BATCH_LIMIT)')
+    args = parser.parse_args()
+
+    app = create_app()
+    batch_size = args.batch_size or app.config['SHOW_BATCH_LIMIT']
+    app.config['SHOW_BATCH_LIMIT'] = max(batch_size, app.config['SHOW_BATCH_LIMIT'])
+    with app.app_context():
+        venue = Venue(name='Benchmark venue', city='Nowhere', state='CA', address='-', genres=['Other'])
+        artist = Artist(name='Benchmark artist', city='Nowhere', state='CA', genres=['Other'])
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        venue_id, artist_id = venue.id, artist.id
+
+    client = app.test_client()
+    timings = []
+    try:
+        started = time.perf_counter()
+        for start_time in start_times(0, args.shows):
+            client.post('/shows/create', data={
+                'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time
+            })
+        timings.append(('form, 1 per request', time.perf_counter() - started))
+
+        times = start_times(args.shows, args.shows)
+        started = time.perf_counter()
+        for first in range(0, len(times), batch_size):
+            response = client.post('/api/shows/batch', json=[
+                {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time}
+                for start_time in times[first:first + batch_size]
+            ])
+            assert response.status_code == 200, response.status_code
+        timings.append(('batch, {0} per request'.format(batch_size), time.perf_counter() - started))
+
+        with app.app_context():
+            count = db.session.scalar(db.select(db.func.count()).select_from(Show).where(Show.venue_id == venue_id))
+        assert count == 2 * args.shows, count
+    finally:
+        with app.app_context():
+            db.session.execute(db.delete(Show).where(Show.venue_id == venue_id))
+            db.session.execute(db.delete(Venue).where(Venue.id == venue_id))
+            db.session.execute(db.delete(Artist).where(Artist.id == artist_id))
+            refresh_area_counts()
+            db.session.commit()
+
+    print('{0:<28} {1:>10} {2:>12}'.format('path', 'seconds', 'shows/s'))
+    for name, elapsed in timings:
+        print('{0:<28} {1:>10.2f} {2:>12.0f}'.format(name, elapsed, args.shows / elapsed))
+    print('speedup: {0:.1f}x'.format(timings[0][1] / timings[1][1]))
+
+
+if __name__ == '__main__':
+    main()
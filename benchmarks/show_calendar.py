@@ -0,0 +1,175 @@
+"""Time the show calendar (/shows?from=&to= and /api/shows/calendar) on a
+large Show table.
+
+By default a temporary SQLite file is filled by datagen.py with ten million
+shows, which takes a while and about a gigabyte of memory:
+
+    python benchmarks/show_calendar.py --shows 10000000
+
+Pass --database-url to measure an existing database as it is. Windows start
+on the second Friday from today, inside the six months of upcoming shows
+datagen.py spreads. Each route is timed --repeat times, and the query plan
+of a filtered calendar page is printed. With --compare-index the routes are
+timed again with the former single-column start_time index in place of
+ix_show_listing.
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from routes import measure, reset_schema  # noqa: E402
+
+# Page of a long calendar that the deep page route starts at.
+DEEP_PAGE = 20
+
+
+def weekend():
+    """The Friday to Sunday window measured, as (friday, sunday)."""
+    today = date.today()
+    friday = today + timedelta(days=(4 - today.weekday()) % 7 + 7)
+    return friday, friday + timedelta(days=2)
+
+
+def calendar_routes(client, first, last):
+    """(name, method, path, body) of each measured route."""
+    window = 'from={0}&to={1}'.format(first, last)
+    month = 'from={0}&to={1}'.format(first, first + timedelta(days=30))
+    path = '/api/shows/calendar?' + window
+    for _ in range(DEEP_PAGE - 1):
+        cursor = client.get(path).get_json()['next_cursor']
+        path = '/api/shows/calendar?{0}&after={1}'.format(window, cursor)
+    return [
+        ('weekend', 'GET', '/shows?' + window, None),
+        ('weekend, JSON', 'GET', '/api/shows/calendar?' + window, None),
+        ('weekend, page {0}'.format(DEEP_PAGE), 'GET', path, None),
+        ('weekend, CA', 'GET', '/api/shows/calendar?{0}&state=CA'.format(window), None),
+        ('weekend, Jazz', 'GET', '/api/shows/calendar?{0}&genre=Jazz'.format(window), None),
+        ('weekend, WY Musical', 'GET', '/api/shows/calendar?{0}&state=WY&genre=Musical_Theatre'.format(window), None),
+        ('month', 'GET', '/shows?' + month, None),
+    ]
+
+
+def query_plan(app, db, first, last):
+    """The database's plan for a calendar page filtered by state and genre."""
+    from app import SHOW_LISTING_KEYS
+    from models import Artist, Venue
+    from queries import calendar_shows
+
+    with app.app_context():
+        select = calendar_shows(
+            datetime.combine(first, datetime.min.time()),
+            datetime.combine(last, datetime.max.time()),
+            [Venue.state == 'CA', Artist.genres.has_any(['Jazz'])]
+        ).order_by(*SHOW_LISTING_KEYS).limit(app.config['PAGE_SIZE'] + 1)
+        connection = db.session.connection()
+        compiled = select.compile(dialect=connection.dialect)
+        params = compiled.construct_params()
+        if connection.dialect.name == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN '
+            params = tuple(params[name] for name in compiled.positiontup)
+        else:
+            explain = 'EXPLAIN '
+        rows = connection.exec_driver_sql(explain + str(compiled), params).all()
+        db.session.remove()
+    return [' '.join(str(value) for value in row[-1:]) for row in rows]
+
+
+def swap_index(app, db, drop, create, columns):
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX IF EXISTS {0}'.format(drop)))
+        db.session.execute(db.text('CREATE INDEX {0} ON "Show" ({1})'.format(create, ', '.join(columns))))
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+
+def report(title, client, counter, routes, args):
+    print('\n' + title)
+    print('{0:<22} {1:>10} {2:>10} {3:>6} {4:>8}'.format('route', 'median ms', 'p95 ms', 'sql', 'status'))
+    serial = itertools.count()
+    for route in routes:
+        result = measure(client, counter, route, args.repeat, args.warmup, serial)
+        print('{0:<22} {1:>10.1f} {2:>10.1f} {3:>6} {4:>8}'.format(
+            route[0], result['median_ms'], result['p95_ms'], result['statements'],
+            ','.join(str(status) for status in result['status'])
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to measure as it is (default: a generated SQLite file)')
+    parser.add_argument('--venues', type=int, default=5000)
+    parser.add_argument('--artists', type=int, default=50000)
+    parser.add_argument('--shows', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--compare-index', action='store_true',
+                        help='also time the routes with the single-column start_time index')
+    args = parser.parse_args()
+
+    scratch = None
+    database_url = args.database_url
+    if database_url is None:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        scratch.close()
+        database_url = 'sqlite:///' + scratch.name
+    # Read by config.py, so set before the app is imported.
+    os.environ.update({
+        'DATABASE_URL': database_url,
+        'PAGE_CACHE_ENABLED': 'false',
+        'TELEMETRY_ENABLED': 'false',
+        'QUERY_BUDGET_MODE': 'off',
+    })
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import create_app
+    from models import db
+    import datagen
+
+    app = create_app()
+    counter = [0]
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    try:
+        if scratch is not None:
+            started = time.perf_counter()
+            with app.app_context():
+                reset_schema(app, db)
+                datagen.generate(args.venues, args.artists, args.shows, seed=args.seed)
+                db.session.execute(db.text('ANALYZE'))
+                db.session.commit()
+            print('Generated {0} venues, {1} artists and {2} shows in {3:.0f}s.'.format(
+                args.venues, args.artists, args.shows, time.perf_counter() - started
+            ))
+
+        first, last = weekend()
+        client = app.test_client()
+        routes = calendar_routes(client, first, last)
+        print('\nPlan of a weekend page filtered by state and genre:')
+        for line in query_plan(app, db, first, last):
+            print('  ' + line)
+        report('ix_show_listing (start_time, venue_id, artist_id)', client, counter, routes, args)
+
+        if args.compare_index:
+            swap_index(app, db, 'ix_show_listing', 'ix_show_start_time', ['start_time'])
+            try:
+                report('ix_show_start_time (start_time)', client, counter, routes, args)
+            finally:
+                swap_index(app, db, 'ix_show_start_time', 'ix_show_listing', ['start_time', 'venue_id', 'artist_id'])
+    finally:
+        if scratch is not None:
+            os.unlink(scratch.name)
+
+
+if __name__ == '__main__':
+    main()
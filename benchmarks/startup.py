@@ -0,0 +1,85 @@
+"""Measure how long a worker takes to boot.
+
+Each run starts a fresh interpreter and times three phases: importing the
+app module, building the app with create_app(), and serving the first
+request to the home page (which touches no database). The median and worst
+of --runs runs are printed, so boot time can be tracked across changes:
+
+    python benchmarks/startup.py --runs 20
+
+Pass --importtime to also list the slowest imports of one run.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+response = application.test_client().get('/')
+served = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': served - created,
+}))
+'''
+
+PHASES = ('import', 'create_app', 'first_request')
+
+
+def run_probe():
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+        stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def slowest_imports(count):
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, check=True,
+        stderr=subprocess.PIPE, universal_newlines=True
+    ).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='number of fresh interpreters to time')
+    parser.add_argument('--importtime', action='store_true', help='list the slowest imports')
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    print('{0:<15} {1:>10} {2:>10}'.format('phase (ms)', 'median', 'max'))
+    totals = [sum(run[phase] for phase in PHASES) for run in runs]
+    for phase, values in [(phase, [run[phase] for run in runs]) for phase in PHASES] + [('total', totals)]:
+        print('{0:<15} {1:>10.1f} {2:>10.1f}'.format(
+            phase, statistics.median(values) * 1000, max(values) * 1000
+        ))
+
+    if args.importtime:
+        print()
+        print('{0:>10}  {1}'.format('cumul (ms)', 'module'))
+        for cumulative, name in slowest_imports(20):
+            print('{0:>10.1f}  {1}'.format(cumulative / 1000.0, name))
+
+
+if __name__ == '__main__':
+    main()
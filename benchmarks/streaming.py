@@ -0,0 +1,127 @@
+"""Compare buffered and streamed rendering of the complete /artists and
+/shows listings.
+
+Buffered is the paginated view asked for every row at once (?limit= with
+MAX_PAGE_SIZE lifted): the rows are built into a list and the page rendered
+into one string before anything is sent. Streamed is ?all=1 with
+LISTING_STREAM_ENABLED, which renders rows as a server-side cursor yields
+them. Each measurement runs in a fresh interpreter, which serves the route
+once to warm up and then reports the time to the first byte, the total time
+and how far the request raised the process's peak RSS:
+
+    python benchmarks/streaming.py --artists 20000 --shows 200000
+
+By default a temporary SQLite file is filled by datagen.py. Pass
+--database-url to measure an existing database as it is.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Large enough for ?limit= to cover any listing in one page.
+UNLIMITED = 10 ** 9
+
+PROBE = '''
+import json, resource, sys, time
+import app
+application = app.create_app()
+client = application.test_client()
+path = sys.argv[1]
+client.get(path.split('?')[0] + '?limit=1').close()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+response = client.get(path, buffered=False)
+chunks = iter(response.response)
+size = len(next(chunks))
+first_byte = time.perf_counter()
+for chunk in chunks:
+    size += len(chunk)
+response.close()
+done = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    'ttfb_ms': (first_byte - started) * 1000,
+    'total_ms': (done - started) * 1000,
+    'peak_rss_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024.0,
+    'bytes': size,
+}))
+'''
+
+MODES = (
+    ('buffered', '?limit={0}'.format(UNLIMITED)),
+    ('streamed', '?all=1'),
+)
+
+
+def run_probe(path, env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, path], cwd=ROOT, env=env, check=True,
+        stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def fill(database_url, venues, artists, shows, seed):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app
+    from datagen import generate
+    from models import db
+    from routes import reset_schema
+
+    app = create_app()
+    with app.app_context():
+        reset_schema(app, db)
+        generate(venues, artists, shows, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to measure as it is (default: a generated SQLite file)')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=20000)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    scratch = None
+    database_url = args.database_url
+    if database_url is None:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        scratch.close()
+        database_url = 'sqlite:///' + scratch.name
+        fill(database_url, args.venues, args.artists, args.shows, args.seed)
+
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        LISTING_STREAM_ENABLED='true',
+        MAX_PAGE_SIZE=str(UNLIMITED),
+        PAGE_CACHE_ENABLED='false',
+        TELEMETRY_ENABLED='false',
+        QUERY_BUDGET_MODE='off',
+    )
+    try:
+        print('{0:<10} {1:<9} {2:>10} {3:>10} {4:>14} {5:>10}'.format(
+            'route', 'mode', 'ttfb ms', 'total ms', 'peak rss +MB', 'MB sent'
+        ))
+        for route in ('/artists', '/shows'):
+            for mode, query in MODES:
+                result = run_probe(route + query, env)
+                print('{0:<10} {1:<9} {2:>10.1f} {3:>10.1f} {4:>14.1f} {5:>10.1f}'.format(
+                    route, mode, result['ttfb_ms'], result['total_ms'],
+                    result['peak_rss_mb'], result['bytes'] / 1048576.0
+                ))
+    finally:
+        if scratch is not None:
+            os.unlink(scratch.name)
+
+
+if __name__ == '__main__':
+    main()
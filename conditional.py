@@ -0,0 +1,66 @@
+from datetime import timezone
+from functools import wraps
+import hashlib
+
+from flask import current_app, g, make_response, request
+
+
+def not_modified(etag, last_modified):
+    """Check the request's validators against the current ones.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 7232.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(fingerprint):
+    """Answer conditional GETs for the decorated view without running it.
+
+    `fingerprint` takes the view arguments and returns a tuple of
+    (parts, last_modified), where `parts` are cheap row versions describing
+    everything the page shows and `last_modified` is a naive UTC datetime or
+    None (see queries.utc_timestamp()). It returns None when it cannot tell;
+    the view then runs as usual, e.g. to produce a 404. The ETag is a hash of
+    the parts, the endpoint and the query string, so it changes with the data
+    and with the page requested. ETAG_SALT should change when templates do.
+
+    The ETag is left in g.etag for the view, so that a page cache below this
+    decorator can key its pages on the data they were rendered from.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            if request.method not in ('GET', 'HEAD'):
+                return view(**view_args)
+            validators = fingerprint(**view_args)
+            if validators is None:
+                return view(**view_args)
+
+            parts, last_modified = validators
+            etag = hashlib.sha1(repr((
+                current_app.config['ETAG_SALT'],
+                request.endpoint,
+                sorted(request.args.items(multi=True)),
+                parts
+            )).encode('utf-8')).hexdigest()
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+            g.etag = etag
+            if not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
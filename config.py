@@ -1,4 +1,9 @@
 import os
+
+from sqlalchemy.pool import NullPool
+
+from pooling import TimedQueuePool
+
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -17,4 +22,130 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'root')
 DB_NAME = os.getenv('DB_NAME', 'fyyur')
 
 DB_PATH = 'postgresql+psycopg2://{}:{}@{}/{}'.format(DB_USER, DB_PASSWORD, DB_HOST, DB_NAME)
-SQLALCHEMY_DATABASE_URI = DB_PATH
+# DATABASE_URL overrides the Postgres settings above, e.g. with a SQLite file.
+SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', DB_PATH)
+
+# Connection pool of each worker process. Checkouts taking longer than
+# DB_POOL_WAIT_WARNING_MS are logged along with how busy the pool was.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_POOL_WAIT_WARNING_MS = int(os.getenv('DB_POOL_WAIT_WARNING_MS', '100'))
+
+# Postgres cancels any statement running longer than this; 0 disables it.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '5000'))
+
+# Behind PgBouncer in transaction pooling mode, PgBouncer does the pooling:
+# each checkout opens a fresh connection (NullPool), and the statement timeout
+# is set per transaction with SET LOCAL instead of as a connection option.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')
+
+if DB_PGBOUNCER:
+    SQLALCHEMY_ENGINE_OPTIONS = {'poolclass': NullPool}
+else:
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': TimedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {
+            'options': '-c statement_timeout={0}'.format(DB_STATEMENT_TIMEOUT_MS)
+        }
+
+# Read replicas, as a comma-separated list of URLs. GET requests read from
+# them in turn; writes and the user's reads for DB_READ_YOUR_WRITES_SECONDS
+# after a write go to the primary. A replica that fails its health check, or
+# lags by more than DB_REPLICA_MAX_LAG seconds, is skipped.
+DB_REPLICA_URLS = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+DB_REPLICA_BINDS = ['replica{0}'.format(i) for i in range(1, len(DB_REPLICA_URLS) + 1)]
+# Connections to a replica give up after DB_REPLICA_CONNECT_TIMEOUT seconds,
+# so that an unreachable one is skipped quickly.
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+
+
+def _replica_options(url):
+    options = dict(SQLALCHEMY_ENGINE_OPTIONS, url=url)
+    if url.startswith('postgresql'):
+        options['connect_args'] = dict(options.get('connect_args', {}), connect_timeout=DB_REPLICA_CONNECT_TIMEOUT)
+    return options
+
+
+SQLALCHEMY_BINDS = dict(
+    (key, _replica_options(url)) for key, url in zip(DB_REPLICA_BINDS, DB_REPLICA_URLS)
+)
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', '10'))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5'))
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', '10'))
+
+# The asyncio read API (asyncapi.py, served with the Flask app by asgi.py)
+# connects through an async driver: by default SQLALCHEMY_DATABASE_URI with
+# asyncpg (Postgres) or aiosqlite (SQLite) swapped in. It shares the pool
+# and statement timeout settings above.
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+# Threads running the Flask views when served through asgi.py.
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '10'))
+
+# Listing pages (/venues, /artists, /shows) are keyset-paginated.
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '200'))
+# When enabled, /artists?all=1 and /shows?all=1 stream the complete listing
+# in one page: rows come from a server-side cursor and the template is
+# rendered as they arrive, so memory stays flat and output starts at once.
+LISTING_STREAM_ENABLED = os.getenv('LISTING_STREAM_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# The /venues landing page lists areas, each with its first venues by name
+# and a link to all of them (/venues?area=).
+AREA_VENUES_LIMIT = int(os.getenv('AREA_VENUES_LIMIT', '10'))
+# /shows?from=&to= (and /api/shows/calendar) list the shows of at most this
+# many days, a page at a time.
+CALENDAR_MAX_DAYS = int(os.getenv('CALENDAR_MAX_DAYS', '31'))
+
+# Search pages show the top N matches along with the total match count.
+SEARCH_RESULT_LIMIT = int(os.getenv('SEARCH_RESULT_LIMIT', '20'))
+
+# Search-as-you-type suggestions served from the in-memory name index.
+TYPEAHEAD_LIMIT = int(os.getenv('TYPEAHEAD_LIMIT', '10'))
+TYPEAHEAD_MAX_LIMIT = int(os.getenv('TYPEAHEAD_MAX_LIMIT', '50'))
+# The name indexes are kept per worker and reloaded from the database once
+# older than this many seconds, to pick up writes served by other workers.
+TYPEAHEAD_MAX_AGE = int(os.getenv('TYPEAHEAD_MAX_AGE', '300'))
+
+# Facet counts (by state, genre and seeking flag) are kept in memory per
+# worker and rebuilt from the database once older than this many seconds,
+# which bounds how long writes served by other workers go uncounted.
+FACETS_MAX_AGE = int(os.getenv('FACETS_MAX_AGE', '300'))
+
+# Most shows accepted by one POST to /api/shows/batch.
+SHOW_BATCH_LIMIT = int(os.getenv('SHOW_BATCH_LIMIT', '500'))
+
+# SQL statements per request are checked against each view's @query_budget:
+# 'off', 'log' (warn in the app log) or 'raise' (fail the request).
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'log' if DEBUG else 'off')
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT', '10'))
+
+# Venue and artist pages list this many upcoming and past shows; older past
+# shows are reached with "load more".
+DETAIL_SHOWS_LIMIT = int(os.getenv('DETAIL_SHOWS_LIMIT', '12'))
+
+# Rendered GET pages are cached per worker process and invalidated by the
+# write handlers; the TTL bounds staleness from writes on other workers.
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', '60'))
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Every request is logged as a JSON line (route, status, latency, SQL count
+# and time, template time, response size) to TELEMETRY_LOG, rotated at
+# TELEMETRY_LOG_MAX_BYTES; `flask fyyur telemetry-report` summarizes it.
+TELEMETRY_ENABLED = os.getenv('TELEMETRY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+TELEMETRY_LOG = os.getenv('TELEMETRY_LOG', 'telemetry.log')
+TELEMETRY_LOG_MAX_BYTES = int(os.getenv('TELEMETRY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+TELEMETRY_LOG_BACKUPS = int(os.getenv('TELEMETRY_LOG_BACKUPS', '5'))
+
+# Mixed into every ETag; change it when templates change so that clients
+# holding pages rendered by the old templates fetch them again.
+ETAG_SALT = os.getenv('ETAG_SALT', '1')
@@ -82,4 +82,24 @@ class Genre(Enum):
         
     @classmethod
     def choices(cls):
-        return [(choice.name, choice.value) for choice in cls]
\ No newline at end of file
+        return [(choice.name, choice.value) for choice in cls]
+
+    # Genres are stored as a bitmask in which each member's bit is its
+    # position in this class: add new genres at the end, never reorder.
+    @classmethod
+    def bit(cls, name):
+        try:
+            return 1 << list(cls.__members__).index(name)
+        except ValueError:
+            raise ValueError('Unknown genre: {0}'.format(name))
+
+    @classmethod
+    def mask(cls, names):
+        mask = 0
+        for name in names:
+            mask |= cls.bit(name)
+        return mask
+
+    @classmethod
+    def names(cls, mask):
+        return [name for position, name in enumerate(cls.__members__) if mask & (1 << position)]
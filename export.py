@@ -0,0 +1,109 @@
+import csv
+from datetime import datetime
+import io
+import json
+import zlib
+
+from models import db, Artist, Show, Venue
+
+# Exported columns of each kind, in output order.
+EXPORTS = {
+    'shows': (Show, (
+        'artist_id', 'venue_id', 'start_time', 'version', 'updated_at',
+    )),
+    'venues': (Venue, (
+        'id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+        'facebook_link', 'website_link', 'seeking_talent', 'seeking_description',
+        'upcoming_shows_count', 'past_shows_count', 'next_show_at', 'version', 'updated_at',
+    )),
+    'artists': (Artist, (
+        'id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+        'facebook_link', 'website_link', 'seeking_venue', 'seeking_description',
+        'upcoming_shows_count', 'past_shows_count', 'next_show_at', 'version', 'updated_at',
+    )),
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Rows fetched per round trip from the server-side cursor, and the size of
+# the chunks handed to the WSGI server.
+FETCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def _ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=_json_default, separators=(',', ':')) + '\n'
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ','.join(value)
+    return value
+
+
+def _csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(columns)
+    for row in rows:
+        yield line([_csv_value(value) for value in row])
+
+
+def export_rows(kind, since=None):
+    """Stream the rows of `kind` changed at or after `since`, oldest first.
+
+    The select runs on a server-side cursor (yield_per), so only FETCH_SIZE
+    rows are held in memory at a time. Rows are stamped with the start time
+    of the transaction that changed them, so an incremental sync should pass
+    a `since` somewhat before the newest updated_at it has seen and treat
+    the overlap as upserts.
+    """
+    model, columns = EXPORTS[kind]
+    select = db.select(*[getattr(model, column) for column in columns])
+    if since is not None:
+        select = select.where(model.updated_at >= since)
+    select = select.order_by(model.updated_at, *model.__table__.primary_key.columns)
+    return columns, db.session.execute(select.execution_options(yield_per=FETCH_SIZE)).tuples()
+
+
+def export_chunks(kind, format, since=None, gzip=False):
+    """Yield the export of `kind` as NDJSON or CSV, in chunks of about
+    CHUNK_BYTES, compressed on the fly when `gzip` is set."""
+    columns, rows = export_rows(kind, since)
+    lines = _ndjson_lines(columns, rows) if format == 'ndjson' else _csv_lines(columns, rows)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if gzip else None
+
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            chunk = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = ''.join(pending).encode('utf-8')
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,180 @@
+from array import array
+import threading
+import time
+import zlib
+
+from sqlalchemy import type_coerce
+
+from enums import Genre, State
+from models import db, Artist, Venue
+
+KINDS = {
+    'venues': Venue,
+    'artists': Artist,
+}
+
+STATES = list(State.__members__)
+GENRES = list(Genre.__members__)
+# One more state slot for rows whose state is not an enums.State member.
+_STATE_SLOTS = len(STATES) + 1
+
+
+def seeking_column(model):
+    return Venue.seeking_talent if model is Venue else Artist.seeking_venue
+
+
+def _state_slot(state):
+    try:
+        return STATES.index(state)
+    except ValueError:
+        return len(STATES)
+
+
+def _bits(mask):
+    position = 0
+    while mask:
+        if mask & 1:
+            yield position
+        mask >>= 1
+        position += 1
+
+
+class FacetCounts(object):
+    """Row counts of one model by state, genre and seeking flag.
+
+    Two flat arrays indexed by enum ordinal hold them: `rows` counts rows
+    per (state, seeking) and `genres` per (state, genre, seeking). A row
+    with several genres is counted once in `rows` and once per genre in
+    `genres`, so every count filtered by at most one genre is exact. Any
+    facet is then a sum over a few hundred array slots at most.
+    """
+
+    __slots__ = ('rows', 'genres')
+
+    def __init__(self):
+        self.rows = array('l', [0]) * (_STATE_SLOTS * 2)
+        self.genres = array('l', [0]) * (_STATE_SLOTS * len(GENRES) * 2)
+
+    def add(self, state, mask, seeking, delta=1):
+        """Count (or with delta=-1, uncount) a row; `mask` is its genre bitmask."""
+        slot = _state_slot(state)
+        seeking = 1 if seeking else 0
+        self.rows[slot * 2 + seeking] += delta
+        for genre in _bits(mask or 0):
+            self.genres[(slot * len(GENRES) + genre) * 2 + seeking] += delta
+
+    def count(self, states, genre, seekings):
+        """Rows in any of `states` (slots) with any of `seekings`, and the
+        genre of ordinal `genre` unless it is None."""
+        total = 0
+        for slot in states:
+            for seeking in seekings:
+                if genre is None:
+                    total += self.rows[slot * 2 + seeking]
+                else:
+                    total += self.genres[(slot * len(GENRES) + genre) * 2 + seeking]
+        return total
+
+    def digest(self):
+        return zlib.crc32(self.genres.tobytes(), zlib.crc32(self.rows.tobytes()))
+
+
+class Facets(object):
+    """Per-process facet counts for venues and artists.
+
+    The counts of a kind are built from the database with one GROUP BY on
+    its first use, and rebuilt once they are older than FACETS_MAX_AGE
+    seconds, which bounds how long writes served by other worker processes
+    go unseen. In between, the create, edit and delete handlers of this
+    process keep them current.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self._built_at = {}
+        self._lock = threading.Lock()
+
+    def _load(self, kind):
+        model = KINDS[kind]
+        seeking = seeking_column(model)
+        rows = db.session.execute(
+            db.select(model.state, type_coerce(model.genres, db.Integer), seeking, db.func.count())
+            .group_by(model.state, model.genres, seeking)
+        )
+        counts = FacetCounts()
+        for state, mask, seeking_value, number in rows:
+            counts.add(state, mask, seeking_value, number)
+        self.counts[kind] = counts
+        self._built_at[kind] = time.monotonic()
+
+    def get(self, kind, max_age):
+        with self._lock:
+            built_at = self._built_at.get(kind)
+            if built_at is None or time.monotonic() - built_at > max_age:
+                self._load(kind)
+            return self.counts[kind]
+
+    # Before the first build there is nothing to keep current: the build
+    # reads the committed rows. A write racing the build waits for its lock.
+
+    @staticmethod
+    def values(entity):
+        """The faceted values of a venue or artist, to pass to add/remove."""
+        seeking = entity.seeking_talent if isinstance(entity, Venue) else entity.seeking_venue
+        return (entity.state, Genre.mask(entity.genres or []), seeking)
+
+    def add(self, kind, values):
+        with self._lock:
+            if kind in self.counts:
+                self.counts[kind].add(*values)
+
+    def remove(self, kind, values):
+        with self._lock:
+            if kind in self.counts:
+                self.counts[kind].add(*values, delta=-1)
+
+    def change(self, kind, old, new):
+        if old != new:
+            self.remove(kind, old)
+            self.add(kind, new)
+
+    def facets(self, kind, max_age, state=None, genres=(), seeking=None):
+        """Count the rows of `kind` per value of each facet, filtered by the
+        selections of the other facets, as {'total', 'state', 'genre',
+        'seeking'}; zero counts are left out.
+
+        `state` is a State name and `seeking` a bool, or None for either.
+        Counts can only be filtered by one genre: with several selected, the
+        total and the state and seeking facets are None.
+        """
+        counts = self.get(kind, max_age)
+        all_states = range(_STATE_SLOTS)
+        states = all_states if state is None else [_state_slot(state)]
+        seekings = (0, 1) if seeking is None else (1 if seeking else 0,)
+        genre = GENRES.index(genres[0]) if len(genres) == 1 else None
+        exact = len(genres) <= 1
+
+        def nonzero(pairs):
+            return dict((name, number) for name, number in pairs if number)
+
+        with self._lock:
+            return {
+                'total': counts.count(states, genre, seekings) if exact else None,
+                'state': nonzero(
+                    (name, counts.count([slot], genre, seekings)) for slot, name in enumerate(STATES)
+                ) if exact else None,
+                'genre': nonzero(
+                    (name, counts.count(states, position, seekings)) for position, name in enumerate(GENRES)
+                ),
+                'seeking': nonzero(
+                    (key, counts.count(states, genre, (value,))) for value, key in ((1, 'true'), (0, 'false'))
+                ) if exact else None,
+            }
+
+    def digest(self, kind, max_age):
+        counts = self.get(kind, max_age)
+        with self._lock:
+            return counts.digest()
+
+
+facets = Facets()
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# Named formats of the `datetime` template filter.
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+    'day': "EEEE MMMM d, y",
+    'time': "h:mma",
+}
+
+# Babel's own named formats, which do not go through a single pattern.
+_BABEL_NAMED = ('full', 'long', 'medium', 'short')
+
+
+@lru_cache(maxsize=None)
+def _compiled(format, locale):
+    """Compile the Babel pattern for (format, locale) once."""
+    from babel import Locale
+    from babel.dates import parse_pattern
+
+    pattern = PATTERNS.get(format, format)
+    if pattern in _BABEL_NAMED:
+        return None, Locale.parse(locale)
+    return parse_pattern(pattern), Locale.parse(locale)
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    import dateutil.parser
+    return dateutil.parser.parse(value)
+
+
+def _zone(value):
+    # Aware datetimes for the same instant in different zones are equal and
+    # hash alike, but render differently, so caches key on the zone too.
+    return getattr(value, 'tzinfo', None)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    """Format a datetime, or a string dateutil can parse, for display.
+
+    Output matches babel.dates.format_datetime(value, pattern, locale=locale)
+    for the pattern that `format` names. Patterns are compiled once per
+    (format, locale), datetimes skip parsing, and results are memoized.
+    """
+    return _format_datetime(value, _zone(value), format, locale)
+
+
+@lru_cache(maxsize=8192)
+def _format_datetime(value, zone, format, locale):
+    date = _to_datetime(value)
+    pattern, babel_locale = _compiled(format, locale)
+    if pattern is None:
+        from babel.dates import format_datetime as babel_format_datetime
+        return babel_format_datetime(date, format, locale=babel_locale)
+    # Babel renders naive datetimes as UTC and aware ones in their own zone.
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return pattern.apply(date, babel_locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+    """Format a whole column of values, formatting each distinct one once."""
+    formatted = {}
+    result = []
+    for value in values:
+        key = (value, _zone(value))
+        text = formatted.get(key)
+        if text is None:
+            text = formatted[key] = format_datetime(value, format, locale)
+        result.append(text)
+    return result
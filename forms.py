@@ -22,6 +22,20 @@ def is_valid_phone(number):
     regex = re.compile('^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
     return regex.match(number)
 
+def check_listing(phone, genres, state):
+    """ The checks VenueForm and ArtistForm run on top of their field
+    validators, also used by the bulk importer.
+
+    Returns (field name, message) for the first failing check, or None.
+    """
+    if not is_valid_phone(phone or ''):
+        return ('phone', 'Invalid phone.')
+    if not set(genres).issubset(dict(Genre.choices()).keys()):
+        return ('genres', 'Invalid genres.')
+    if state not in dict(State.choices()).keys():
+        return ('state', 'Invalid state.')
+    return None
+
 
 
         
@@ -84,16 +98,10 @@ class VenueForm(Form):
         if not validated:
             return False
 
-        if not is_valid_phone(self.phone.data):
-            self.phone.errors.append('Invalid phone.')
-            return False
-
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
-            self.genres.errors.append('Invalid genres.')
-            return False
-
-        if self.state.data not in dict(State.choices()).keys():
-            self.state.errors.append('Invalid state.')
+        error = check_listing(self.phone.data, self.genres.data, self.state.data)
+        if error is not None:
+            field, message = error
+            getattr(self, field).errors.append(message)
             return False
 
         # if pass validation
@@ -145,16 +153,10 @@ class ArtistForm(Form):
         if not validated:
             return False
 
-        if not is_valid_phone(self.phone.data):
-            self.phone.errors.append('Invalid phone.')
-            return False
-
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
-            self.genres.errors.append('Invalid genres.')
-            return False
-
-        if self.state.data not in dict(State.choices()).keys():
-            self.state.errors.append('Invalid state.')
+        error = check_listing(self.phone.data, self.genres.data, self.state.data)
+        if error is not None:
+            field, message = error
+            getattr(self, field).errors.append(message)
             return False
 
         # if pass validation
@@ -0,0 +1,495 @@
+import csv
+from datetime import datetime, timezone
+import io
+import json
+import os
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from wtforms.fields import BooleanField, DateTimeField, SelectField, SelectMultipleField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import StopValidation, ValidationError
+
+from forms import ArtistForm, ShowForm, VenueForm, check_listing
+from models import db, Artist, Show, Venue, assign_areas, refresh_area_counts, refresh_show_counters
+from search import reindex
+from typeahead import typeahead
+
+
+class _Field(object):
+    """The little of a WTForms field that validators look at."""
+
+    __slots__ = ('data', 'raw_data', 'errors')
+
+    def __init__(self, data, raw_data):
+        self.data = data
+        self.raw_data = raw_data
+        self.errors = []
+
+    @staticmethod
+    def gettext(string):
+        return string
+
+    @staticmethod
+    def ngettext(singular, plural, n):
+        return singular if n == 1 else plural
+
+
+class RowRules(object):
+    """The validation rules of a form class, applied to plain dicts.
+
+    The fields, their choices and their validators are read from the form
+    class once, so checking a row costs a few function calls instead of a
+    WTForms form. `extra` takes the converted row and returns a list of
+    (field, message) pairs. Like the checks forms.check_listing() adds to
+    VenueForm and ArtistForm, it only runs on rows that pass the field
+    validators, unless `always` is set; its errors are then added to theirs.
+    """
+
+    def __init__(self, form_class, extra=None, always=False):
+        self.fields = []
+        for name in dir(form_class):
+            unbound = getattr(form_class, name)
+            if isinstance(unbound, UnboundField):
+                choices = unbound.kwargs.get('choices')
+                self.fields.append((
+                    name,
+                    unbound.field_class,
+                    frozenset(value for value, _ in choices) if choices else None,
+                    list(unbound.kwargs.get('validators') or ()),
+                    unbound.kwargs.get('format', '%Y-%m-%d %H:%M:%S'),
+                ))
+        self.extra = extra
+        self.always = always
+
+    @staticmethod
+    def _convert(field_class, value, format):
+        """Turn a raw value into field data, as process_formdata() would."""
+        if issubclass(field_class, BooleanField):
+            if isinstance(value, str):
+                return value.strip().lower() not in ('', 'false', 'f', 'no', 'n', '0')
+            return bool(value)
+        if issubclass(field_class, SelectMultipleField):
+            if value is None or value == '':
+                return []
+            if isinstance(value, str):
+                return [item.strip() for item in value.split(',') if item.strip()]
+            return [str(item) for item in value]
+        if value is None:
+            return None
+        if issubclass(field_class, DateTimeField):
+            if isinstance(value, datetime):
+                return value
+            try:
+                return datetime.strptime(value, format)
+            except ValueError:
+                # Also take ISO timestamps, as written by /api/export.
+                value = datetime.fromisoformat(value)
+                if value.tzinfo is not None:
+                    value = value.astimezone(timezone.utc).replace(tzinfo=None)
+                return value
+        return str(value)
+
+    def validate(self, row):
+        """Return (data, errors) for `row`; errors maps field names to messages."""
+        data, errors = {}, {}
+        for name, field_class, choices, validators, format in self.fields:
+            raw = row.get(name)
+            try:
+                field = _Field(self._convert(field_class, raw, format), raw)
+            except (TypeError, ValueError):
+                errors[name] = ['Not a valid datetime value.']
+                continue
+            if choices is not None:
+                values = field.data if isinstance(field.data, list) else [field.data]
+                invalid = [value for value in values if value not in choices]
+                if invalid and issubclass(field_class, (SelectField, SelectMultipleField)):
+                    field.errors.append('Not a valid choice: {0}.'.format(', '.join(map(str, invalid))))
+            for validator in validators:
+                try:
+                    validator(None, field)
+                except StopValidation as e:
+                    if e.args and e.args[0]:
+                        field.errors.append(e.args[0])
+                    break
+                except ValidationError as e:
+                    field.errors.append(e.args[0])
+            if field.errors:
+                errors[name] = field.errors
+            data[name] = field.data
+
+        if self.extra is not None and (self.always or not errors):
+            for name, message in self.extra(data):
+                messages = errors.setdefault(name, [])
+                if message not in messages:
+                    messages.append(message)
+        return data, errors
+
+
+def _listing_check(data):
+    error = check_listing(data['phone'], data['genres'], data['state'])
+    return [] if error is None else [error]
+
+
+def _show_check(data):
+    errors = []
+    for name in ('artist_id', 'venue_id'):
+        try:
+            data[name] = int(data.get(name))
+        except (TypeError, ValueError):
+            errors.append((name, 'Not a valid id.'))
+    return errors
+
+
+# Form rules and model of each importable kind.
+KINDS = {
+    'venues': (lambda: RowRules(VenueForm, _listing_check), Venue),
+    'artists': (lambda: RowRules(ArtistForm, _listing_check), Artist),
+    'shows': (lambda: RowRules(ShowForm, _show_check, always=True), Show),
+}
+
+
+def read_rows(path, format=None):
+    """Yield the rows of a CSV (with a header) or NDJSON file as dicts."""
+    format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with io.open(path, newline='' if format == 'csv' else None, encoding='utf-8') as f:
+        if format == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+#----------------------------------------------------------------------------#
+# Loading.
+#----------------------------------------------------------------------------#
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return value
+
+
+def copy_rows(connection, table, columns, rows):
+    """Load `rows` with COPY into a staging table, then move them over.
+
+    Rows whose key already exists are skipped (ON CONFLICT DO NOTHING), so a
+    batch can be loaded again after a crash. Returns the number inserted.
+    The staging table is dropped again at once, so that several loads can
+    share a transaction.
+    """
+    staging = '{0}_import'.format(table.name)
+    column_list = ', '.join('"{0}"'.format(column) for column in columns)
+    connection.exec_driver_sql(
+        'CREATE TEMP TABLE "{0}" (LIKE "{1}" INCLUDING DEFAULTS)'.format(staging, table.name)
+    )
+    # COPY bypasses the column types, so apply their conversions here (the
+    # genres list becomes its bitmask).
+    processors = [
+        (column, table.c[column].type.bind_processor(connection.dialect)) for column in columns
+    ]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow([
+            _copy_value(process(row[column]) if process and row[column] is not None else row[column])
+            for column, process in processors
+        ])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY "{0}" ({1}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'.format(staging, column_list),
+            buffer
+        )
+    finally:
+        cursor.close()
+    inserted = connection.exec_driver_sql(
+        'INSERT INTO "{0}" ({2}) SELECT {2} FROM "{1}" ON CONFLICT DO NOTHING'.format(
+            table.name, staging, column_list
+        )
+    ).rowcount
+    connection.exec_driver_sql('DROP TABLE "{0}"'.format(staging))
+    return inserted
+
+
+def _insert_new(connection, table):
+    """INSERT into `table` that skips rows whose key exists and returns the
+    keys of the rows it inserted."""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    else:
+        statement = insert(table)
+    return statement.returning(*table.primary_key.columns)
+
+
+def insert_rows(connection, table, columns, rows):
+    """Load `rows` with a batched executemany INSERT, skipping existing keys."""
+    params = [dict((column, row[column]) for column in columns) for row in rows]
+    return len(connection.execute(_insert_new(connection, table), params).all())
+
+
+def supports_copy(connection):
+    return connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+
+
+#----------------------------------------------------------------------------#
+# Checkpoints.
+#----------------------------------------------------------------------------#
+
+def load_checkpoint(path, kind, source):
+    """Return the number of input rows already loaded, per the checkpoint."""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    if state.get('kind') != kind or state.get('source') != os.path.abspath(source):
+        raise ValueError('Checkpoint {0} belongs to another import.'.format(path))
+    return state['rows']
+
+
+def save_checkpoint(path, kind, source, rows, totals):
+    state = dict(totals, kind=kind, source=os.path.abspath(source), rows=rows)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+#----------------------------------------------------------------------------#
+# Import.
+#----------------------------------------------------------------------------#
+
+def run_import(kind, path, format=None, batch_size=5000, method='auto',
+               checkpoint=None, rejects=None, report=print):
+    """Validate and load the rows of `path` into `kind`, one batch per commit.
+
+    Every committed batch is recorded in the `checkpoint` file, and a rerun
+    with the same checkpoint skips the input rows already loaded. Rejected
+    rows go to `rejects` as NDJSON, with their line number and errors.
+    Returns the totals: rows read, inserted, skipped as existing, rejected.
+    """
+    make_rules, model = KINDS[kind]
+    rules = make_rules()
+    table = model.__table__
+    columns = [name for name, _, _, _, _ in rules.fields]
+    # Venue and artist ids are kept when given (e.g. from /api/export), so
+    # that shows imported next can refer to them.
+    keeps_ids = kind in ('venues', 'artists')
+
+    if method == 'auto':
+        method = 'copy' if supports_copy(db.session.connection()) else 'executemany'
+    load = copy_rows if method == 'copy' else insert_rows
+
+    done = load_checkpoint(checkpoint, kind, path) if checkpoint else 0
+    totals = {'read': done, 'inserted': 0, 'existing': 0, 'rejected': 0}
+    imported_ids = False
+    # A resumed import adds to the rejects of the earlier runs.
+    rejects_file = open(rejects, 'a' if done else 'w') if rejects else None
+    if done:
+        report('Resuming after row {0} from {1}.'.format(done, checkpoint))
+
+    def flush(batch, rejected, first_row, last_row):
+        started = time.perf_counter()
+        connection = db.session.connection()
+        if kind == 'shows':
+            valid = _check_references(batch, rejects_file)
+        else:
+            valid = [row for _, row in batch]
+        inserted = 0
+        with_ids = [row for row in valid if row.get('id') is not None]
+        without_ids = [row for row in valid if row.get('id') is None]
+        if with_ids:
+            inserted += load(connection, table, ['id'] + columns, with_ids)
+        if without_ids:
+            inserted += load(connection, table, columns, without_ids)
+        if kind == 'shows':
+            refresh_show_counters(Venue, set(row['venue_id'] for row in valid))
+            refresh_show_counters(Artist, set(row['artist_id'] for row in valid))
+        else:
+            assign_areas(model)
+            if kind == 'venues':
+                refresh_area_counts()
+        db.session.commit()
+
+        rejected += len(batch) - len(valid)
+        totals['read'] = last_row
+        totals['inserted'] += inserted
+        totals['existing'] += len(valid) - inserted
+        totals['rejected'] += rejected
+        if checkpoint:
+            save_checkpoint(checkpoint, kind, path, last_row, totals)
+        elapsed = time.perf_counter() - started
+        report('rows {0}-{1}: {2} inserted, {3} existing, {4} rejected in {5:.2f}s ({6:.0f} rows/s)'.format(
+            first_row, last_row, inserted, len(valid) - inserted, rejected,
+            elapsed, (last_row - first_row + 1) / elapsed if elapsed else 0
+        ))
+        return bool(with_ids)
+
+    try:
+        batch, rejected, first_row, line = [], 0, done + 1, 0
+        for line, raw in enumerate(read_rows(path, format), 1):
+            if line <= done:
+                continue
+            data, errors = rules.validate(raw)
+            if keeps_ids and not errors:
+                try:
+                    data['id'] = int(raw['id']) if raw.get('id') not in (None, '') else None
+                except (TypeError, ValueError):
+                    errors['id'] = ['Not a valid id.']
+            if errors:
+                _reject(rejects_file, line, raw, errors)
+                rejected += 1
+            else:
+                batch.append((line, data))
+            if line - first_row + 1 >= batch_size:
+                imported_ids |= flush(batch, rejected, first_row, line)
+                batch, rejected, first_row = [], 0, line + 1
+        if line >= first_row:
+            imported_ids |= flush(batch, rejected, first_row, line)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+
+    if keeps_ids:
+        connection = db.session.connection()
+        reindex(connection, model)
+        if imported_ids and connection.dialect.name == 'postgresql':
+            # Move the id sequence past the imported ids.
+            connection.exec_driver_sql(
+                'SELECT setval(pg_get_serial_sequence(\'"{0}"\', \'id\'), max(id)) FROM "{0}"'.format(table.name)
+            )
+        db.session.commit()
+        typeahead.invalidate()
+    return totals
+
+
+def _reject(rejects_file, line, raw, errors):
+    if rejects_file is not None:
+        rejects_file.write(json.dumps({'line': line, 'row': raw, 'errors': errors}, default=str) + '\n')
+
+
+def _check_references(batch, rejects_file):
+    """Drop the shows of `batch` whose venue or artist does not exist,
+    looking all of them up in two queries."""
+    venue_ids = set(row['venue_id'] for _, row in batch)
+    artist_ids = set(row['artist_id'] for _, row in batch)
+    venues = set(db.session.scalars(db.select(Venue.id).where(Venue.id.in_(venue_ids)))) if venue_ids else set()
+    artists = set(db.session.scalars(db.select(Artist.id).where(Artist.id.in_(artist_ids)))) if artist_ids else set()
+    valid = []
+    for line, row in batch:
+        errors = {}
+        if row['venue_id'] not in venues:
+            errors['venue_id'] = ['No venue with this id.']
+        if row['artist_id'] not in artists:
+            errors['artist_id'] = ['No artist with this id.']
+        if errors:
+            _reject(rejects_file, line, row, errors)
+        else:
+            valid.append(row)
+    return valid
+
+
+#----------------------------------------------------------------------------#
+# Show batches.
+#----------------------------------------------------------------------------#
+
+def _show_key(row):
+    return (row['artist_id'], row['venue_id'], row['start_time'])
+
+
+def find_show_references(rows):
+    """Look up the venues, artists and shows that `rows` refer to.
+
+    One query, a UNION ALL of three set lookups, returns which venue ids and
+    artist ids exist and which (artist_id, venue_id, start_time) keys are
+    already taken. Rows without a start_time only have their ids looked up.
+    """
+    venue_ids = set(row['venue_id'] for row in rows)
+    artist_ids = set(row['artist_id'] for row in rows)
+    keys = set(_show_key(row) for row in rows if row.get('start_time') is not None)
+    no_id = db.cast(db.null(), db.Integer)
+    no_time = db.cast(db.null(), db.DateTime)
+    query = db.union_all(
+        db.select(db.literal_column("'venue'"), no_id, Venue.id, no_time)
+        .where(Venue.id.in_(venue_ids)),
+        db.select(db.literal_column("'artist'"), Artist.id, no_id, no_time)
+        .where(Artist.id.in_(artist_ids)),
+        db.select(db.literal_column("'show'"), Show.artist_id, Show.venue_id, Show.start_time)
+        .where(db.tuple_(Show.artist_id, Show.venue_id, Show.start_time).in_(keys)),
+    )
+    venues, artists, shows = set(), set(), set()
+    for kind, artist_id, venue_id, start_time in db.session.execute(query):
+        if kind == 'venue':
+            venues.add(venue_id)
+        elif kind == 'artist':
+            artists.add(artist_id)
+        else:
+            shows.add((artist_id, venue_id, start_time))
+    return venues, artists, shows
+
+
+def create_show_batch(items):
+    """Validate a batch of shows and insert the valid ones in one INSERT.
+
+    `items` are dicts with the fields of ShowForm. Returns a result for each
+    item, in order, and the rows inserted. A result is {'status': 'created'},
+    {'status': 'duplicate'} for a show that exists already or repeats an
+    earlier item, or {'status': 'invalid', 'errors': {...}} with every error
+    found. The caller commits.
+    """
+    rules = KINDS['shows'][0]()
+    checked = [rules.validate(item if isinstance(item, dict) else {}) for item in items]
+    # Items with other errors have their ids looked up too, so that their
+    # errors are complete.
+    with_ids = [
+        data for data, errors in checked
+        if 'venue_id' not in errors and 'artist_id' not in errors
+    ]
+    venues, artists, taken = find_show_references(with_ids) if with_ids else ((), (), ())
+
+    results, accepted = [], {}
+    for index, (row, errors) in enumerate(checked):
+        if 'venue_id' not in errors and 'artist_id' not in errors:
+            if row['venue_id'] not in venues:
+                errors['venue_id'] = ['No venue with this id.']
+            if row['artist_id'] not in artists:
+                errors['artist_id'] = ['No artist with this id.']
+        if errors:
+            results.append({'status': 'invalid', 'errors': errors})
+            continue
+        key = _show_key(row)
+        if key in taken or key in accepted:
+            results.append({'status': 'duplicate'})
+        else:
+            results.append(None)
+            accepted[key] = index
+
+    created = []
+    if accepted:
+        # A show added by another request since the lookup is skipped by
+        # ON CONFLICT and reported as a duplicate.
+        connection = db.session.connection()
+        statement = _insert_new(connection, Show.__table__).values([
+            {'artist_id': key[0], 'venue_id': key[1], 'start_time': key[2]} for key in accepted
+        ])
+        inserted = set(tuple(row) for row in connection.execute(statement))
+        for key, index in accepted.items():
+            if key in inserted:
+                results[index] = {'status': 'created'}
+                created.append(checked[index][0])
+            else:
+                results[index] = {'status': 'duplicate'}
+        refresh_show_counters(Venue, set(row['venue_id'] for row in created))
+        refresh_show_counters(Artist, set(row['artist_id'] for row in created))
+    return results, created
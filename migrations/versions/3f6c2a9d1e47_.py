@@ -0,0 +1,41 @@
+"""add denormalized show counters to Venue and Artist
+
+Revision ID: 3f6c2a9d1e47
+Revises: 923b87421783
+Create Date: 2026-10-18 10:12:41.208133
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2a9d1e47'
+down_revision = '923b87421783'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, fk in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('next_show_at', sa.DateTime(), nullable=True))
+
+        # Backfill from the existing show history.
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" s WHERE s.{fk} = "{table}".id AND s.start_time > now()), '
+            'past_shows_count = (SELECT count(*) FROM "Show" s WHERE s.{fk} = "{table}".id AND s.start_time <= now()), '
+            'next_show_at = (SELECT min(s.start_time) FROM "Show" s WHERE s.{fk} = "{table}".id AND s.start_time > now())'
+            .format(table=table, fk=fk)
+        )
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('next_show_at')
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
@@ -0,0 +1,66 @@
+"""add full-text and trigram search indexes to Venue and Artist
+
+Revision ID: 5b8e1f0c7a92
+Revises: 3f6c2a9d1e47
+Create Date: 2026-10-18 11:02:17.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '5b8e1f0c7a92'
+down_revision = '3f6c2a9d1e47'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite builds its FTS5 tables on first use (see search.py).
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(SEARCH_VECTOR_FUNCTION)
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute(
+            'CREATE TRIGGER "{0}_search_vector_update" '
+            'BEFORE INSERT OR UPDATE OF name, city, state, genres ON "{0}" '
+            'FOR EACH ROW EXECUTE FUNCTION fyyur_search_vector_update()'.format(table)
+        )
+        # Fire the trigger once for the existing rows.
+        op.execute('UPDATE "{0}" SET name = name'.format(table))
+        op.create_index(
+            'ix_{0}_search_vector'.format(table.lower()), table, ['search_vector'],
+            postgresql_using='gin'
+        )
+        op.create_index(
+            'ix_{0}_name_trgm'.format(table.lower()), table, ['name'],
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{0}_name_trgm'.format(table.lower()), table_name=table)
+        op.drop_index('ix_{0}_search_vector'.format(table.lower()), table_name=table)
+        op.execute('DROP TRIGGER IF EXISTS "{0}_search_vector_update" ON "{0}"'.format(table))
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION IF EXISTS fyyur_search_vector_update()')
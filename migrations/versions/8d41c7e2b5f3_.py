@@ -0,0 +1,41 @@
+"""index Show, Venue and Artist for their real access paths
+
+Revision ID: 8d41c7e2b5f3
+Revises: 5b8e1f0c7a92
+Create Date: 2026-10-18 12:25:09.417652
+
+The indexes are built with CREATE INDEX CONCURRENTLY so the migration can run
+against a live database. Concurrent builds cannot run inside a transaction,
+hence the autocommit block. If a concurrent build fails it leaves an INVALID
+index behind; drop it and rerun the upgrade.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c7e2b5f3'
+down_revision = '5b8e1f0c7a92'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_show_start_time', 'Show', ['start_time']),
+    ('ix_venue_city_state', 'Venue', ['city', 'state']),
+    ('ix_venue_lower_name', 'Venue', [sa.text('lower(name)')]),
+    ('ix_artist_lower_name', 'Artist', [sa.text('lower(name)')]),
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,36 @@
+"""index Show start times in listing order
+
+Revision ID: a1c58e3f6b90
+Revises: f2b7d04c9a61
+Create Date: 2026-10-18 22:41:53.118204
+
+Replaces the start_time index with one on (start_time, venue_id,
+artist_id), the keys of the /shows listing and its calendar, so that a
+time range is read in page order and a page stops after its last row.
+
+Built and dropped concurrently, like 8d41c7e2b5f3; drop any INVALID index
+left by a failed build and rerun the upgrade.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c58e3f6b90'
+down_revision = 'f2b7d04c9a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_show_listing', 'Show', ['start_time', 'venue_id', 'artist_id'], postgresql_concurrently=True
+        )
+        op.drop_index('ix_show_start_time', table_name='Show', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_show_start_time', 'Show', ['start_time'], postgresql_concurrently=True)
+        op.drop_index('ix_show_listing', table_name='Show', postgresql_concurrently=True)
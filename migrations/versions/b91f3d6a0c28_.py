@@ -0,0 +1,30 @@
+"""add updated_at and version columns to Venue, Artist and Show
+
+Revision ID: b91f3d6a0c28
+Revises: 8d41c7e2b5f3
+Create Date: 2026-10-18 13:48:52.190366
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b91f3d6a0c28'
+down_revision = '8d41c7e2b5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False))
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,36 @@
+"""index updated_at on Show, Venue and Artist for incremental exports
+
+Revision ID: c47e9a2f5d10
+Revises: b91f3d6a0c28
+Create Date: 2026-10-18 17:06:41.528203
+
+Built concurrently, like 8d41c7e2b5f3; drop any INVALID index left by a
+failed build and rerun the upgrade.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e9a2f5d10'
+down_revision = 'b91f3d6a0c28'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_show_updated_at', 'Show', ['updated_at']),
+    ('ix_venue_updated_at', 'Venue', ['updated_at']),
+    ('ix_artist_updated_at', 'Artist', ['updated_at']),
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,200 @@
+"""store Venue and Artist genres as an integer bitmask
+
+Revision ID: e3a91c5d7b24
+Revises: c47e9a2f5d10
+Create Date: 2026-10-18 18:02:36.715430
+
+Each genre's bit is its position in enums.Genre, frozen below. Existing
+genres are matched to a genre by name or label, ignoring case; anything
+unrecognised becomes Other. The tables are rewritten, so run this in a
+quiet period. On Postgres the search trigger is rebuilt to read the genre
+names from the mask, and covering listing indexes are added for the
+?genre= filters.
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a91c5d7b24'
+down_revision = 'c47e9a2f5d10'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist')
+
+# enums.Genre as of this revision: (name, label), in bit order.
+GENRES = (
+    ('Alternative', 'Alternative'),
+    ('Blues', 'Blues'),
+    ('Classical', 'Classical'),
+    ('Country', 'Country'),
+    ('Electronic', 'Electronic'),
+    ('Folk', 'Folk'),
+    ('Funk', 'Funk'),
+    ('Hip_Hop', 'Hip-Hop'),
+    ('Heavy_Metal', 'Heavy Metal'),
+    ('Instrumental', 'Instrumental'),
+    ('Jazz', 'Jazz'),
+    ('Musical_Theatre', 'Musical Theatre'),
+    ('Pop', 'Pop'),
+    ('Punk', 'Punk'),
+    ('RnB', 'R&B'),
+    ('Reggae', 'Reggae'),
+    ('Rock_n_Roll', 'Rock n Roll'),
+    ('Soul', 'Soul'),
+    ('Other', 'Other'),
+)
+OTHER = 1 << [name for name, label in GENRES].index('Other')
+
+GENRE_VALUES = '(VALUES {0}) AS g(bit, name, label)'.format(', '.join(
+    "({0}, '{1}', '{2}')".format(1 << position, name, label)
+    for position, (name, label) in enumerate(GENRES)
+))
+
+INDEXES = (
+    ('ix_venue_listing_genres', 'Venue', ['city', 'state', 'name', 'id']),
+    ('ix_artist_listing_genres', 'Artist', ['name', 'id']),
+)
+
+GENRE_NAMES_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_genre_names(mask integer) RETURNS text AS $$
+    SELECT coalesce(string_agg(g.name, ' ' ORDER BY g.bit), '') FROM {0} WHERE mask & g.bit <> 0
+$$ LANGUAGE sql IMMUTABLE
+""".format(GENRE_VALUES)
+
+SEARCH_VECTOR_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('simple', {0}), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _create_search_triggers():
+    for table in TABLES:
+        op.execute(
+            'CREATE TRIGGER "{0}_search_vector_update" '
+            'BEFORE INSERT OR UPDATE OF name, city, state, genres ON "{0}" '
+            'FOR EACH ROW EXECUTE FUNCTION fyyur_search_vector_update()'.format(table)
+        )
+        op.execute('UPDATE "{0}" SET name = name'.format(table))
+
+
+def _drop_search_triggers():
+    for table in TABLES:
+        op.execute('DROP TRIGGER IF EXISTS "{0}_search_vector_update" ON "{0}"'.format(table))
+
+
+def _create_name_index(table):
+    # Batch mode rebuilds the table without its expression indexes.
+    op.create_index('ix_{0}_lower_name'.format(table.lower()), table, [sa.text('lower(name)')])
+
+
+def _genre_bit(genre):
+    genre = genre.strip().strip('"').lower()
+    for position, (name, label) in enumerate(GENRES):
+        if genre in (name.lower(), label.lower()):
+            return 1 << position
+    return OTHER
+
+
+def _parse_genres(value):
+    """Genres stored as text: a Postgres array literal, JSON or a list
+    separated by commas."""
+    value = (value or '').strip()
+    if value.startswith('['):
+        return json.loads(value)
+    return [genre for genre in value.strip('{}').split(',') if genre.strip()]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        for table in TABLES:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.add_column(sa.Column('genres_mask', sa.Integer(), server_default='0', nullable=False))
+            rows = bind.execute(sa.text('SELECT id, genres FROM "{0}"'.format(table))).all()
+            for row in rows:
+                mask = 0
+                for genre in _parse_genres(row.genres):
+                    mask |= _genre_bit(genre)
+                bind.execute(
+                    sa.text('UPDATE "{0}" SET genres_mask = :mask WHERE id = :id'.format(table)),
+                    {'mask': mask, 'id': row.id}
+                )
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_column('genres')
+                batch_op.alter_column('genres_mask', new_column_name='genres', server_default=None)
+            _create_name_index(table)
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns)
+        return
+
+    _drop_search_triggers()
+    for table in TABLES:
+        column = [c for c in sa.inspect(bind).get_columns(table) if c['name'] == 'genres'][0]
+        if isinstance(column['type'], sa.ARRAY):
+            genres = 'genres'
+        else:
+            genres = "CASE WHEN genres LIKE '{%' THEN genres::text[] ELSE string_to_array(genres, ',') END"
+        op.add_column(table, sa.Column('genres_mask', sa.Integer(), server_default='0', nullable=False))
+        op.execute(
+            'UPDATE "{table}" SET genres_mask = ('
+            'SELECT coalesce(bit_or(coalesce(g.bit, {other})), 0) '
+            'FROM unnest({genres}) AS e(genre) '
+            'LEFT JOIN {values} ON lower(btrim(e.genre)) IN (lower(g.name), lower(g.label)) '
+            "WHERE btrim(e.genre) <> '')".format(table=table, other=OTHER, genres=genres, values=GENRE_VALUES)
+        )
+        op.drop_column(table, 'genres')
+        op.alter_column(table, 'genres_mask', new_column_name='genres', server_default=None)
+    op.execute(GENRE_NAMES_FUNCTION)
+    op.execute(SEARCH_VECTOR_FUNCTION.format('fyyur_genre_names(NEW.genres)'))
+    _create_search_triggers()
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, postgresql_include=['genres'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    if bind.dialect.name != 'postgresql':
+        for table in TABLES:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.add_column(sa.Column('genres_list', sa.String(length=255), server_default='{}', nullable=False))
+            rows = bind.execute(sa.text('SELECT id, genres FROM "{0}"'.format(table))).all()
+            for row in rows:
+                names = [name for position, (name, label) in enumerate(GENRES) if row.genres & (1 << position)]
+                bind.execute(
+                    sa.text('UPDATE "{0}" SET genres_list = :genres WHERE id = :id'.format(table)),
+                    {'genres': '{' + ','.join(names) + '}', 'id': row.id}
+                )
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_column('genres')
+                batch_op.alter_column('genres_list', new_column_name='genres', server_default=None)
+            _create_name_index(table)
+        return
+
+    _drop_search_triggers()
+    for table in TABLES:
+        op.add_column(table, sa.Column('genres_list', postgresql.ARRAY(sa.String()), server_default='{}', nullable=False))
+        op.execute(
+            'UPDATE "{table}" SET genres_list = ARRAY('
+            'SELECT g.name FROM {values} WHERE "{table}".genres & g.bit <> 0 ORDER BY g.bit)'
+            .format(table=table, values=GENRE_VALUES)
+        )
+        op.drop_column(table, 'genres')
+        op.alter_column(table, 'genres_list', new_column_name='genres', server_default=None)
+    op.execute(SEARCH_VECTOR_FUNCTION.format("coalesce(array_to_string(NEW.genres, ' '), '')"))
+    op.execute('DROP FUNCTION IF EXISTS fyyur_genre_names(integer)')
+    _create_search_triggers()
@@ -0,0 +1,91 @@
+"""normalized Area table referenced by Venue and Artist
+
+Revision ID: f2b7d04c9a61
+Revises: e3a91c5d7b24
+Create Date: 2026-10-18 21:14:08.302617
+
+Existing (city, state) values are backfilled into one area per city and
+state, ignoring case and surrounding whitespace, the way models.area_key()
+normalizes them; each area keeps the alphabetically first spelling. Areas
+carry their venue count. The venue listing index moves from (city, state)
+order to (area_id, name, id), which also serves ?area= lookups.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b7d04c9a61'
+down_revision = 'e3a91c5d7b24'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist')
+
+INDEXES = (
+    ('ix_venue_area_listing', 'Venue'),
+    ('ix_artist_area_listing', 'Artist'),
+)
+
+
+def _foreign_key(table):
+    return 'fk_{0}_area_id'.format(table.lower())
+
+
+def upgrade():
+    op.create_table('Area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=255), nullable=False),
+    sa.Column('city_key', sa.String(length=255), nullable=False),
+    sa.Column('state', sa.String(length=255), nullable=False),
+    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('city_key', 'state', name='uq_area_city_key_state')
+    )
+    bind = op.get_bind()
+    for table in TABLES:
+        if bind.dialect.name == 'sqlite':
+            # ADD COLUMN takes an inline reference; a batch rebuild would
+            # lose the lower(name) indexes.
+            op.execute('ALTER TABLE "{0}" ADD COLUMN area_id INTEGER REFERENCES "Area" (id)'.format(table))
+        else:
+            op.add_column(table, sa.Column('area_id', sa.Integer(), nullable=True))
+            op.create_foreign_key(_foreign_key(table), table, 'Area', ['area_id'], ['id'])
+
+    op.execute(
+        'INSERT INTO "Area" (city, city_key, state) '
+        'SELECT min(trim(city)), lower(trim(city)), state FROM ('
+        '  SELECT city, state FROM "Venue" UNION ALL SELECT city, state FROM "Artist"'
+        ') AS located '
+        "WHERE state IS NOT NULL AND trim(city) <> '' "
+        'GROUP BY lower(trim(city)), state'
+    )
+    for table in TABLES:
+        op.execute(
+            'UPDATE "{0}" SET area_id = ('
+            'SELECT "Area".id FROM "Area" '
+            'WHERE "Area".city_key = lower(trim("{0}".city)) AND "Area".state = "{0}".state)'.format(table)
+        )
+    op.execute('UPDATE "Area" SET venue_count = (SELECT count(*) FROM "Venue" WHERE "Venue".area_id = "Area".id)')
+
+    op.drop_index('ix_venue_listing_genres', table_name='Venue')
+    for name, table in INDEXES:
+        op.create_index(name, table, ['area_id', 'name', 'id'], postgresql_include=['genres'])
+
+
+def downgrade():
+    for name, table in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.create_index('ix_venue_listing_genres', 'Venue', ['city', 'state', 'name', 'id'], postgresql_include=['genres'])
+    bind = op.get_bind()
+    for table in reversed(TABLES):
+        if bind.dialect.name == 'sqlite':
+            # The rebuild drops the expression index, so add it back.
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_column('area_id')
+            op.create_index('ix_{0}_lower_name'.format(table.lower()), table, [sa.text('lower(name)')])
+        else:
+            op.drop_constraint(_foreign_key(table), table, type_='foreignkey')
+            op.drop_column(table, 'area_id')
+    op.drop_table('Area')
@@ -1,43 +1,358 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, event, func, insert, literal, text, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
 
-db = SQLAlchemy()
+from enums import Genre
+from routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class GenreSet(db.TypeDecorator):
+    """A list of enums.Genre names, stored as an integer bitmask.
+
+    Lists are read back in Genre order. `column.has_any(names)` matches rows
+    with at least one of the genres in a single bitwise test.
+    """
+    impl = db.Integer
+    cache_ok = True
+
+    class comparator_factory(db.TypeDecorator.Comparator):
+        def has_any(self, names):
+            return type_coerce(self.expr, db.Integer).op('&')(Genre.mask(names)) != 0
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else Genre.mask(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else Genre.names(value)
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    # The primary key leads with artist_id; these cover lookups by venue,
+    # time ranges in listing order (/shows and its calendar) and
+    # incremental exports.
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_listing', 'start_time', 'venue_id', 'artist_id'),
+        db.Index('ix_show_updated_at', 'updated_at'),
+    )
 
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
     start_time = db.Column(db.DateTime, primary_key=True)
+    # Last change time and row version, which the ORM bumps on every update
+    # and checks in its WHERE clause (optimistic concurrency). Together they
+    # back the HTTP validators (ETag / Last-Modified).
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now())
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+class Area(db.Model):
+    """A city of a state, shared by the venues and artists located there.
+
+    Spellings of a city that differ only in case or surrounding whitespace
+    are one area (see area_key()); `city` keeps the first spelling seen.
+    """
+    __tablename__ = 'Area'
+    __table_args__ = (
+        # Also the order of the /venues landing page.
+        db.UniqueConstraint('city_key', 'state', name='uq_area_city_key_state'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(255), nullable=False)
+    city_key = db.Column(db.String(255), nullable=False)
+    # An enums.State name, as the forms validate it.
+    state = db.Column(db.String(255), nullable=False)
+    # Denormalized, kept in step by the Venue mapper events below.
+    venue_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_city_state', 'city', 'state'),
+        # Listing order, covering genres so ?genre= filters skip the heap.
+        db.Index('ix_venue_area_listing', 'area_id', 'name', 'id', postgresql_include=['genres']),
+        db.Index('ix_venue_lower_name', func.lower(text('name'))),
+        db.Index('ix_venue_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(255))
     state = db.Column(db.String(255))
+    # Derived from city and state by the mapper events below.
+    area_id = db.Column(db.Integer, db.ForeignKey('Area.id'))
     address = db.Column(db.String(255))
     phone = db.Column(db.String(20))
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(GenreSet, nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(255))
     website_link = db.Column(db.String(255))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(1000))
-    shows = db.relationship('Show', backref = 'venue', lazy='joined', cascade="all, delete")
+    # Denormalized show counters, kept in step by the Show mapper events
+    # below and by roll_over_shows() once upcoming shows start.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime)
+    # Last change time and row version, which the ORM bumps on every update
+    # and checks in its WHERE clause (optimistic concurrency). Together they
+    # back the HTTP validators (ETag / Last-Modified).
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now())
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Not eager: each route picks its own loader options (see app.py).
+    shows = db.relationship('Show', backref = 'venue', lazy='select', cascade="all, delete")
+
+    __mapper_args__ = {'version_id_col': version}
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_lower_name', func.lower(text('name'))),
+        # Listing order, covering genres so ?genre= filters skip the heap.
+        db.Index('ix_artist_listing_genres', 'name', 'id', postgresql_include=['genres']),
+        db.Index('ix_artist_area_listing', 'area_id', 'name', 'id', postgresql_include=['genres']),
+        db.Index('ix_artist_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(255))
     state = db.Column(db.String(255))
+    # Derived from city and state by the mapper events below.
+    area_id = db.Column(db.Integer, db.ForeignKey('Area.id'))
     phone = db.Column(db.String(20))
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(GenreSet, nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(255))
     website_link = db.Column(db.String(255))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(1000))
-    shows = db.relationship('Show', backref = 'artist', lazy='joined', cascade="all, delete")
+    # Denormalized show counters, kept in step by the Show mapper events
+    # below and by roll_over_shows() once upcoming shows start.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime)
+    # Last change time and row version, which the ORM bumps on every update
+    # and checks in its WHERE clause (optimistic concurrency). Together they
+    # back the HTTP validators (ETag / Last-Modified).
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now())
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Not eager: each route picks its own loader options (see app.py).
+    shows = db.relationship('Show', backref = 'artist', lazy='select', cascade="all, delete")
+
+    __mapper_args__ = {'version_id_col': version}
+
+
+#----------------------------------------------------------------------------#
+# Areas.
+#----------------------------------------------------------------------------#
+
+def area_key(city):
+    """The normalized form of a city column or value, which areas are keyed
+    by. Computed by the database on every path, so that the mapper events,
+    bulk loads and migrations all agree on it."""
+    return func.lower(func.trim(city))
+
+def _insert_area(connection):
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(Area).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(Area).on_conflict_do_nothing()
+    return insert(Area)
+
+def _find_area(connection, city, state):
+    """Return the id of the area of (city, state), creating it if needed,
+    or None without a city and state.
+
+    On PostgreSQL and SQLite this is one upsert, whose no-op update makes
+    RETURNING give the id of an existing area too.
+    """
+    if not (city or '').strip() or not state:
+        return None
+    values = dict(city=city.strip(), city_key=area_key(literal(city)), state=state)
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        upsert = (postgresql if dialect == 'postgresql' else sqlite).insert(Area).values(**values)
+        return connection.execute(
+            upsert.on_conflict_do_update(index_elements=['city_key', 'state'], set_={'city': Area.city})
+            .returning(Area.id)
+        ).scalar_one()
+    find = db.select(Area.id).where(Area.city_key == values['city_key'], Area.state == state)
+    area_id = connection.execute(find).scalar()
+    if area_id is None:
+        connection.execute(insert(Area).values(**values))
+        area_id = connection.execute(find).scalar()
+    return area_id
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artist, 'before_insert')
+@event.listens_for(Artist, 'before_update')
+def _assign_area(mapper, connection, entity):
+    attrs = db.inspect(entity).attrs
+    if entity.area_id is None or attrs.city.history.has_changes() or attrs.state.history.has_changes():
+        entity.area_id = _find_area(connection, entity.city, entity.state)
+
+def _count_venue(connection, area_id, delta):
+    if area_id is not None:
+        connection.execute(
+            db.update(Area).where(Area.id == area_id).values(venue_count=Area.venue_count + delta)
+        )
+
+@event.listens_for(Venue, 'after_insert')
+def _count_inserted_venue(mapper, connection, venue):
+    _count_venue(connection, venue.area_id, 1)
+
+@event.listens_for(Venue, 'after_update')
+def _count_moved_venue(mapper, connection, venue):
+    history = db.inspect(venue).attrs.area_id.history
+    for area_id in history.deleted:
+        _count_venue(connection, area_id, -1)
+    for area_id in history.added:
+        _count_venue(connection, area_id, 1)
+
+@event.listens_for(Venue, 'after_delete')
+def _count_deleted_venue(mapper, connection, venue):
+    _count_venue(connection, venue.area_id, -1)
+
+def assign_areas(model):
+    """Point the venues or artists that have no area yet at theirs, creating
+    the missing areas, in two set-based statements.
+
+    For writes that bypass the mapper events, such as bulk loads; follow
+    with refresh_area_counts(). The caller commits.
+    """
+    city = func.trim(model.city)
+    pending = (
+        db.select(func.min(city), area_key(model.city), model.state)
+        .where(model.area_id.is_(None), model.state.isnot(None), city != '')
+        .group_by(area_key(model.city), model.state)
+    )
+    db.session.execute(
+        _insert_area(db.session.connection()).from_select(['city', 'city_key', 'state'], pending)
+    )
+    db.session.execute(
+        db.update(model)
+        .where(model.area_id.is_(None))
+        .values(area_id=(
+            db.select(Area.id)
+            .where(Area.city_key == area_key(model.city), Area.state == model.state)
+            .scalar_subquery()
+        ))
+        .execution_options(synchronize_session=False)
+    )
+
+def refresh_area_counts():
+    """Recount the venues of every area. The caller commits."""
+    db.session.execute(
+        db.update(Area)
+        .values(venue_count=(
+            db.select(func.count()).where(Venue.area_id == Area.id).scalar_subquery()
+        ))
+        .execution_options(synchronize_session=False)
+    )
+
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+def _counted_owners(show):
+    return ((Venue, show.venue_id), (Artist, show.artist_id))
+
+def _next_show_at(model):
+    fk = Show.venue_id if model is Venue else Show.artist_id
+    return (
+        db.select(func.min(Show.start_time))
+        .where(fk == model.id, Show.start_time > func.now())
+        .scalar_subquery()
+    )
+
+@event.listens_for(Show, 'after_insert')
+def _count_inserted_show(mapper, connection, show):
+    is_upcoming = literal(show.start_time, db.DateTime) > func.now()
+    for model, owner_id in _counted_owners(show):
+        connection.execute(
+            db.update(model)
+            .where(model.id == owner_id)
+            .values(
+                upcoming_shows_count=model.upcoming_shows_count + case((is_upcoming, 1), else_=0),
+                past_shows_count=model.past_shows_count + case((is_upcoming, 0), else_=1),
+                next_show_at=case(
+                    (is_upcoming & (model.next_show_at.is_(None) | (model.next_show_at > show.start_time)), show.start_time),
+                    else_=model.next_show_at
+                ),
+                updated_at=func.now()
+            )
+        )
+
+@event.listens_for(Show, 'after_delete')
+def _count_deleted_show(mapper, connection, show):
+    is_upcoming = literal(show.start_time, db.DateTime) > func.now()
+    for model, owner_id in _counted_owners(show):
+        connection.execute(
+            db.update(model)
+            .where(model.id == owner_id)
+            .values(
+                upcoming_shows_count=model.upcoming_shows_count - case((is_upcoming, 1), else_=0),
+                past_shows_count=model.past_shows_count - case((is_upcoming, 0), else_=1),
+                next_show_at=case(
+                    (model.next_show_at == show.start_time, _next_show_at(model)),
+                    else_=model.next_show_at
+                ),
+                updated_at=func.now()
+            )
+        )
+
+def _recount_shows(model, criterion):
+    fk = Show.venue_id if model is Venue else Show.artist_id
+    upcoming = (
+        db.select(func.count())
+        .where(fk == model.id, Show.start_time > func.now())
+        .scalar_subquery()
+    )
+    past = (
+        db.select(func.count())
+        .where(fk == model.id, Show.start_time <= func.now())
+        .scalar_subquery()
+    )
+    return db.session.execute(
+        db.update(model)
+        .where(criterion)
+        .values(
+            upcoming_shows_count=upcoming,
+            past_shows_count=past,
+            next_show_at=_next_show_at(model),
+            updated_at=func.now()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def refresh_show_counters(model, ids=None):
+    """Recompute the show counters of the given venues or artists, or of all
+    of them when `ids` is None.
+
+    For writes that bypass the Show mapper events, such as bulk deletes.
+    The caller commits.
+    """
+    if ids is None:
+        _recount_shows(model, db.true())
+    elif ids:
+        _recount_shows(model, model.id.in_(ids))
+
+def roll_over_shows():
+    """Move shows that have started from the upcoming to the past counters.
+
+    Only venues and artists whose ``next_show_at`` has passed are touched, and
+    their counters are recomputed from the Show table. Returns the number of
+    venue and artist rows updated.
+    """
+    updated = 0
+    for model in (Venue, Artist):
+        updated += _recount_shows(model, model.next_show_at <= func.now()).rowcount
+    db.session.commit()
+    return updated
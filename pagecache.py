@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from functools import wraps
+import threading
+import time
+
+from flask import current_app, g, make_response, request, session
+
+from routing import reads_own_writes
+
+
+class _Entry(object):
+    __slots__ = ('body', 'status', 'headers', 'expires', 'tags', 'size')
+
+    def __init__(self, body, status, headers, expires, tags):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.expires = expires
+        self.tags = tags
+        self.size = len(body)
+
+
+class _Flight(object):
+    __slots__ = ('done', 'entry')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+class PageCache(object):
+    """LRU cache of rendered GET responses with TTL and a byte-size cap.
+
+    Pages are keyed by endpoint, view arguments and query string, plus the
+    ETag that a conditional() decorator above the cache computed from the
+    current data, if any. Pages carry tags such as 'venues' or 'venue:3'. The
+    write handlers invalidate exactly the tags they affect. Concurrent misses
+    on the same key are coalesced, so only one of them renders while the
+    others wait for its result, unless a write invalidates the cache in the
+    meantime.
+
+    The cache lives in process memory, so each worker process keeps its own
+    copy. Writes handled by one worker change the ETag of the pages they
+    affect, so the others stop serving the old pages at once; pages without
+    a conditional() decorator only see them through PAGE_CACHE_TTL.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._by_tag = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._generation = 0
+        self._stats = dict.fromkeys(
+            ('hits', 'misses', 'coalesced', 'stores', 'evictions', 'expirations', 'invalidations'), 0
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_TTL', 60)
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.extensions['page_cache'] = self
+
+    #  Bookkeeping, always called with the lock held.
+    #  ----------------------------------------------------------------
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        return entry
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= now:
+            self._drop(key)
+            self._stats['expirations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, entry, max_bytes):
+        if key in self._entries:
+            self._drop(key)
+        if entry.size > max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        for tag in entry.tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while self._bytes > max_bytes:
+            self._drop(next(iter(self._entries)))
+            self._stats['evictions'] += 1
+        self._stats['stores'] += 1
+
+    #  Public API.
+    #  ----------------------------------------------------------------
+
+    def invalidate(self, *tags):
+        """Drop every cached page carrying any of `tags`."""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._by_tag.get(tag, ())):
+                    self._drop(key)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def add_tags(*tags):
+        """Attach extra tags to the page being rendered, e.g. one per venue
+        listed on an artist page."""
+        g.setdefault('page_cache_tags', set()).update(tags)
+
+    def cached(self, *tags):
+        """Cache the decorated GET view under `tags`.
+
+        A tag may be a string or a callable that takes the view arguments and
+        returns a list of strings.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**view_args):
+                config = current_app.config
+                # Pages carrying flashed messages are one-off renders, and
+                # users who just wrote get pages read from the primary.
+                if (not config['PAGE_CACHE_ENABLED'] or request.method != 'GET'
+                        or '_flashes' in session or reads_own_writes()):
+                    return view(**view_args)
+
+                key = (
+                    request.endpoint,
+                    tuple(sorted(view_args.items())),
+                    tuple(sorted(request.args.items(multi=True))),
+                    g.get('etag')
+                )
+                now = time.time()
+                with self._lock:
+                    entry = self._lookup(key, now)
+                    if entry is not None:
+                        self._stats['hits'] += 1
+                        return self._respond(entry, 'HIT')
+                    self._stats['misses'] += 1
+                    flight = self._flights.get(key)
+                    leader = flight is None
+                    if leader:
+                        flight = self._flights[key] = _Flight()
+                        generation = self._generation
+
+                if not leader:
+                    flight.done.wait()
+                    if flight.entry is not None:
+                        with self._lock:
+                            self._stats['coalesced'] += 1
+                        return self._respond(flight.entry, 'COALESCED')
+                    return view(**view_args)
+
+                try:
+                    g.page_cache_tags = set()
+                    response = make_response(view(**view_args))
+                    if response.status_code == 200 and not response.is_streamed:
+                        page_tags = set(g.page_cache_tags)
+                        for tag in tags:
+                            page_tags.update(tag(**view_args) if callable(tag) else [tag])
+                        entry = _Entry(
+                            response.get_data(),
+                            response.status_code,
+                            [('Content-Type', response.headers['Content-Type'])],
+                            now + config['PAGE_CACHE_TTL'],
+                            frozenset(page_tags)
+                        )
+                        with self._lock:
+                            # If a write landed mid-render the page may predate
+                            # it: neither store nor share it, and the waiting
+                            # requests render their own.
+                            if generation == self._generation:
+                                flight.entry = entry
+                                self._store(key, entry, config['PAGE_CACHE_MAX_BYTES'])
+                    response.headers['X-Cache'] = 'MISS'
+                    return response
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _respond(entry, outcome):
+        response = current_app.response_class(entry.body, status=entry.status, headers=entry.headers)
+        response.headers['X-Cache'] = outcome
+        return response
+
+
+page_cache = PageCache()
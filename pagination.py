@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page(object):
+    """One page of a keyset-paginated listing."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    """Encode the sort-key values of a row as an opaque, URL-safe cursor."""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _decode_value(key, value):
+    """Check one cursor value against the column type of its sort key."""
+    if value is None:
+        if key.nullable:
+            return None
+    else:
+        expected = key.type.python_type
+        if expected is datetime:
+            try:
+                return datetime.fromisoformat(value)
+            except (TypeError, ValueError) as e:
+                raise InvalidCursor('Malformed cursor: {0}'.format(e))
+        # JSON booleans load as bools, which isinstance() takes for ints;
+        # the bounds and the NUL check keep out what the drivers reject.
+        if expected is int:
+            if isinstance(value, int) and not isinstance(value, bool) and -2**63 <= value < 2**63:
+                return value
+        elif expected is str:
+            if isinstance(value, str) and '\x00' not in value:
+                return value
+        elif isinstance(value, expected):
+            return value
+    raise InvalidCursor('Cursor does not match this listing.')
+
+
+def decode_cursor(cursor, keys):
+    """Decode a cursor produced by encode_cursor() for the given sort keys.
+
+    Every value must have the type of its key's column, and may be None
+    only for a nullable one; anything else raises InvalidCursor.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Malformed cursor: {0}'.format(e))
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor('Cursor does not match this listing.')
+    return tuple(_decode_value(key, value) for key, value in zip(keys, values))
+
+
+def keyset_page(session, select, keys, limit, after=None, before=None, descending=False):
+    """Run `select` and return one Page of at most `limit` rows.
+
+    Rows are ordered by `keys` (highest first when `descending`), which must
+    be non-null and together unique, and the page starts right after the
+    `after` cursor (or ends right before the `before` cursor). The position
+    is a single range predicate on the keys, so deep pages cost the same as
+    the first one.
+    """
+    row_key = tuple_(*keys)
+
+    def follows(position):
+        return row_key < tuple_(*position) if descending else row_key > tuple_(*position)
+
+    def precedes(position):
+        return row_key > tuple_(*position) if descending else row_key < tuple_(*position)
+
+    forward = [key.desc() for key in keys] if descending else list(keys)
+    backward = list(keys) if descending else [key.desc() for key in keys]
+
+    if before is not None:
+        query = select.where(precedes(decode_cursor(before, keys))).order_by(*backward)
+    else:
+        query = select
+        if after is not None:
+            query = query.where(follows(decode_cursor(after, keys)))
+        query = query.order_by(*forward)
+
+    rows = session.execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    def cursor_for(row):
+        return encode_cursor([row._mapping[key] for key in keys])
+
+    return Page(
+        rows,
+        next_cursor=cursor_for(rows[-1]) if rows and has_next else None,
+        prev_cursor=cursor_for(rows[0]) if rows and has_prev else None
+    )
@@ -0,0 +1,56 @@
+import logging
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+def _logger():
+    return current_app.logger if has_app_context() else logger
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that logs slow connection checkouts.
+
+    A checkout that takes DB_POOL_WAIT_WARNING_MS or longer, whether waiting
+    for a connection to be returned or opening a new one, is logged together
+    with how many of the pool's connections were checked out at the time.
+    """
+
+    def _do_get(self):
+        busy = self.checkedout()
+        start = time.perf_counter()
+        connection = super(TimedQueuePool, self)._do_get()
+        waited = (time.perf_counter() - start) * 1000
+        threshold = current_app.config.get('DB_POOL_WAIT_WARNING_MS', 100) if has_app_context() else 100
+        if waited >= threshold:
+            capacity = self.size() + max(self._max_overflow, 0)
+            _logger().warning(
+                'Waited %.0f ms for a database connection; %d of %d were checked out%s',
+                waited, busy, capacity, ' (pool exhausted)' if busy >= capacity else ''
+            )
+        return connection
+
+
+@event.listens_for(Engine, 'begin')
+def _set_local_statement_timeout(conn):
+    """Behind PgBouncer, apply DB_STATEMENT_TIMEOUT_MS to each transaction.
+
+    In transaction pooling mode a server connection is shared between
+    clients, so session settings would leak to other clients and startup
+    options are not passed on; SET LOCAL lasts until the transaction ends.
+    """
+    if not has_app_context() or conn.dialect.name != 'postgresql':
+        return
+    config = current_app.config
+    if not config.get('DB_PGBOUNCER') or not config.get('DB_STATEMENT_TIMEOUT_MS'):
+        return
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('SET LOCAL statement_timeout = %d' % int(config['DB_STATEMENT_TIMEOUT_MS']))
+    finally:
+        cursor.close()
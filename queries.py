@@ -0,0 +1,305 @@
+from itertools import groupby
+
+from sqlalchemy import DateTime, cast, func, tuple_
+
+from models import db, Area, Artist, Show, Venue
+from pagination import InvalidCursor, decode_cursor, keyset_page
+
+# Areas in alphabetical order, backed by their unique constraint.
+AREA_LISTING_KEYS = (Area.city_key, Area.state)
+# Venues are keyed by area first so that every area stays contiguous in the
+# listing, and by (name, id) within an area. Areas come in the order they
+# were created.
+VENUE_LISTING_KEYS = (Venue.area_id, Venue.name, Venue.id)
+
+
+def listed_areas(*columns):
+    """Select `columns` of the areas with venues, which /venues lists."""
+    return db.select(*columns).where(Area.venue_count > 0)
+
+
+def area_venues_changed():
+    """The latest change among the venues of an area, as a column of an
+    Area select."""
+    return (
+        db.select(func.max(Venue.updated_at))
+        .where(Venue.area_id == Area.id)
+        .scalar_subquery()
+    )
+
+
+def area_listing(limit, venues_per_area, after=None, before=None):
+    """Build one page of the /venues landing page from two queries.
+
+    The page is a keyset scan of the Area table, which holds one row per
+    area with its cached venue count. The first `venues_per_area` venues of
+    each area on the page, by name, are then read in one windowed query on
+    the (area_id, name, id) index. Returns the areas together with the Page.
+    """
+    page = keyset_page(
+        db.session,
+        listed_areas(Area.id, Area.city, Area.state, Area.venue_count, *AREA_LISTING_KEYS),
+        AREA_LISTING_KEYS,
+        limit,
+        after=after,
+        before=before
+    )
+
+    venues = {}
+    if page.items:
+        ranked = (
+            db.select(
+                Venue.id,
+                Venue.name,
+                Venue.area_id,
+                Venue.upcoming_shows_count.label('num_upcoming_shows'),
+                func.row_number().over(partition_by=Venue.area_id, order_by=(Venue.name, Venue.id)).label('position')
+            )
+            .where(Venue.area_id.in_([row.id for row in page]))
+            .subquery()
+        )
+        rows = db.session.execute(
+            db.select(ranked)
+            .where(ranked.c.position <= venues_per_area)
+            .order_by(ranked.c.area_id, ranked.c.position)
+        )
+        for area_id, group in groupby(rows, key=lambda row: row.area_id):
+            venues[area_id] = [
+                {
+                    "id": row.id,
+                    "name": row.name,
+                    "num_upcoming_shows": row.num_upcoming_shows
+                }
+                for row in group
+            ]
+
+    areas = [
+        {
+            "id": row.id,
+            "city": row.city,
+            "state": row.state,
+            "venue_count": row.venue_count,
+            "venues": venues.get(row.id, [])
+        }
+        for row in page
+    ]
+    return areas, page
+
+
+def venue_areas(limit, after=None, before=None, where=()):
+    """Build one page of the filtered /venues listing from a single query.
+
+    Every venue (matching the `where` criteria) is returned once with its
+    denormalized upcoming show count and its area, and the rows are grouped
+    into areas as they stream back in order. Returns the areas together
+    with the underlying Page, whose cursors link to the neighbouring pages.
+    """
+    page = keyset_page(
+        db.session,
+        db.select(
+            Venue.id,
+            Venue.name,
+            Venue.area_id,
+            Area.city,
+            Area.state,
+            Area.venue_count,
+            Venue.upcoming_shows_count.label('num_upcoming_shows')
+        ).join(Area, Area.id == Venue.area_id).where(*where),
+        VENUE_LISTING_KEYS,
+        limit,
+        after=after,
+        before=before
+    )
+
+    areas = []
+    for area_id, group in groupby(page, key=lambda row: row.area_id):
+        group = list(group)
+        areas.append({
+            "id": area_id,
+            "city": group[0].city,
+            "state": group[0].state,
+            "venue_count": group[0].venue_count,
+            "venues": [
+                {
+                    "id": row.id,
+                    "name": row.name,
+                    "num_upcoming_shows": row.num_upcoming_shows
+                }
+                for row in group
+            ]
+        })
+    return areas, page
+
+
+def utc_timestamp(column):
+    """`column`, a timestamp written by the database's now(), as naive UTC.
+
+    PostgreSQL stores now() in the session's time zone in a timestamp
+    without time zone, so it is cast back to an instant and read in UTC;
+    SQLite's CURRENT_TIMESTAMP is UTC already.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return column
+    return func.timezone('UTC', cast(column, DateTime(timezone=True)))
+
+
+def entity_fingerprint(model, entity_id, limit, past_after=None):
+    """Return the HTTP validators of a venue or artist page.
+
+    One query reads the entity's version, counters and whether its next show
+    has started, plus the latest change among the venues or artists of the
+    shows the page lists (the next `limit` upcoming ones and the page of past
+    ones after `past_after`), whose names and images it shows. Only those
+    shows are read, however many the entity has. Timestamps are UTC. Returns
+    None if the entity does not exist or the cursor is invalid.
+    """
+    other, own_fk, other_fk = _other_side(model)
+    keys = (Show.start_time, other_fk)
+    listed = db.select(*keys).where(own_fk == entity_id)
+    upcoming = listed.where(Show.start_time > func.now()).order_by(*keys)
+    past = listed.where(Show.start_time <= func.now()).order_by(*[key.desc() for key in keys])
+    if past_after is not None:
+        try:
+            past = past.where(tuple_(*keys) < tuple_(*decode_cursor(past_after, keys)))
+        except InvalidCursor:
+            return None
+    # The shows are picked from the Show indexes first, then joined.
+    others_changed = [
+        db.select(func.max(utc_timestamp(other.updated_at)))
+        .select_from(shown)
+        .join(other, other.id == shown.c[other_fk.name])
+        .scalar_subquery()
+        for shown in (upcoming.limit(limit).subquery(), past.limit(limit).subquery())
+    ]
+    row = db.session.execute(
+        db.select(
+            model.version,
+            utc_timestamp(model.updated_at),
+            model.upcoming_shows_count,
+            model.past_shows_count,
+            model.next_show_at <= func.now(),
+            *others_changed
+        )
+        .where(model.id == entity_id)
+    ).first()
+    if row is None:
+        return None
+    last_modified = max(filter(None, (row[1], row[5], row[6])))
+    return tuple(row), last_modified
+
+
+def listing_fingerprint(select, keys, **page):
+    """Return the HTTP validators of one page of a keyset-paginated listing.
+
+    `select` picks the version columns of what the page shows; it is run
+    with the listing's own keys and page arguments, so the fingerprint covers
+    exactly the rows of the page, deletions included. Listings carry no
+    Last-Modified, since a deleted row would not move it.
+    """
+    try:
+        rows = keyset_page(db.session, select.add_columns(*keys), keys, **page)
+    except InvalidCursor:
+        return None
+    return tuple(tuple(row) for row in rows), None
+
+
+# Rows fetched per round trip by the streamed listings.
+STREAM_FETCH_SIZE = 1000
+
+
+def listing_batches(select, keys):
+    """Yield a whole listing in listing order, one batch of rows at a time.
+
+    The rows come from a server-side cursor (yield_per), so only one batch
+    is held in memory however long the listing is.
+    """
+    result = db.session.execute(
+        select.order_by(*keys).execution_options(yield_per=STREAM_FETCH_SIZE)
+    )
+    for batch in result.partitions():
+        yield batch
+
+
+def calendar_shows(start, end, where=()):
+    """Select the shows starting in [start, end] that match `where`, with
+    just the venue and artist columns a calendar shows.
+
+    The range is read from the (start_time, venue_id, artist_id) index in
+    listing order, so a page stops after its last row instead of sorting
+    the whole range.
+    """
+    return (
+        db.select(
+            Show.venue_id,
+            Show.artist_id,
+            Show.start_time,
+            Venue.name.label('venue_name'),
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')
+        )
+        .join(Venue, Venue.id == Show.venue_id)
+        .join(Artist, Artist.id == Show.artist_id)
+        .where(Show.start_time.between(start, end), *where)
+    )
+
+
+def show_days(rows):
+    """Group shows in start time order by the day they start on, as a
+    list of (date, rows)."""
+    return [
+        (day, list(group))
+        for day, group in groupby(rows, key=lambda row: row.start_time.date())
+    ]
+
+
+def _other_side(model):
+    if model is Venue:
+        return Artist, Show.venue_id, Show.artist_id
+    return Venue, Show.artist_id, Show.venue_id
+
+
+def show_listing(model, entity_id):
+    """Select the shows of one venue or artist, joined to the other side."""
+    other, own_fk, other_fk = _other_side(model)
+    prefix = 'artist' if model is Venue else 'venue'
+    select = (
+        db.select(
+            other_fk,
+            other.name.label(prefix + '_name'),
+            other.image_link.label(prefix + '_image_link'),
+            Show.start_time
+        )
+        .join(other, other.id == other_fk)
+        .where(own_fk == entity_id)
+    )
+    return select, (Show.start_time, other_fk)
+
+
+def upcoming_shows(model, entity_id, limit):
+    """Return the next `limit` shows of a venue or artist, soonest first.
+
+    "Upcoming" is decided by the database clock, not the app server's.
+    """
+    select, keys = show_listing(model, entity_id)
+    rows = db.session.execute(
+        select.where(Show.start_time > func.now()).order_by(*keys).limit(limit)
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def past_shows(model, entity_id, limit, after=None):
+    """Return one Page of the past shows of a venue or artist, latest first.
+
+    The Page's next_cursor continues the list ("load more").
+    """
+    select, keys = show_listing(model, entity_id)
+    page = keyset_page(
+        db.session,
+        select.where(Show.start_time <= func.now()),
+        keys,
+        limit,
+        after=after,
+        descending=True
+    )
+    page.items = [dict(row._mapping) for row in page.items]
+    return page
@@ -0,0 +1,96 @@
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(statements):
+    """Declare the maximum number of SQL statements a view may execute."""
+    def decorator(view):
+        view.query_budget = statements
+        return view
+    return decorator
+
+
+def statement_count():
+    """Return the number of SQL statements executed so far in this request."""
+    return g.get('sql_statements', 0)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def _overrun():
+    """Describe how the current request went over its budget, or None."""
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', current_app.config['QUERY_BUDGET_DEFAULT'])
+    used = statement_count()
+    if used <= budget:
+        return None
+    return '{0} {1} ({2}) executed {3} SQL statements, over its budget of {4}'.format(
+        request.method, request.path, request.endpoint, used, budget
+    )
+
+
+@event.listens_for(Session, 'before_commit')
+def _before_commit(db_session):
+    # Flush first so the count covers everything the commit writes; raising
+    # here leaves the transaction open, for the view to roll back.
+    if not has_request_context() or current_app.config.get('QUERY_BUDGET_MODE') != 'raise':
+        return
+    db_session.flush()
+    _raise_if_over_budget()
+
+
+def _raise_if_over_budget():
+    message = _overrun()
+    if message is not None:
+        # Raised once; the error response is not checked again.
+        g.query_budget_raised = True
+        raise QueryBudgetExceeded(message)
+
+
+class QueryGuard(object):
+    """Count the SQL statements of every request and check them against the
+    budget declared by the view with @query_budget.
+
+    QUERY_BUDGET_MODE selects what happens when a view goes over budget:
+    'off' does nothing, 'log' logs a warning and 'raise' fails the request
+    with QueryBudgetExceeded. In 'raise' mode the check also runs before
+    every commit, which then fails instead; statements after a write
+    request's last commit are only logged, as its data is written. Views
+    without a declared budget are held to QUERY_BUDGET_DEFAULT.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_BUDGET_MODE', 'off')
+        app.config.setdefault('QUERY_BUDGET_DEFAULT', 10)
+        app.before_request(self._reset)
+        app.after_request(self._check)
+
+    def _reset(self):
+        g.sql_statements = 0
+
+    def _check(self, response):
+        mode = current_app.config['QUERY_BUDGET_MODE']
+        if mode == 'off' or g.get('query_budget_raised'):
+            return response
+
+        if mode == 'raise' and request.method in ('GET', 'HEAD'):
+            _raise_if_over_budget()
+        else:
+            message = _overrun()
+            if message is not None:
+                current_app.logger.warning(message)
+        return response
@@ -0,0 +1,203 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+# Flask session key holding the time until which the user's reads go to the
+# primary, so that they see their own writes.
+PRIMARY_UNTIL = 'db_primary_until'
+
+# Replication lag of a Postgres standby, in seconds. It is 0 once everything
+# received has been replayed, and on a server that is not a standby.
+_PG_LAG = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+def use_primary(view):
+    """Send all queries of the decorated view to the primary, e.g. for forms
+    whose row versions must be current."""
+    view.db_target = 'primary'
+    return view
+
+
+def use_replica(view):
+    """Let the decorated view read from a replica even though it is not a
+    GET, e.g. for searches posted from a form."""
+    view.db_target = 'replica'
+    return view
+
+
+def reads_own_writes():
+    """True while the current user's reads must see their recent writes."""
+    return session.get(PRIMARY_UNTIL, 0) > time.time()
+
+
+def _read_engine():
+    """The replica engine this request reads from, or None for the primary.
+
+    It is chosen once per request, so that all the reads of a page see the
+    same snapshot.
+    """
+    if not has_request_context():
+        return None
+    if 'db_read_engine' not in g:
+        view = current_app.view_functions.get(request.endpoint)
+        target = getattr(view, 'db_target', None)
+        if target is None:
+            target = 'replica' if request.method in ('GET', 'HEAD') else 'primary'
+        replicas = current_app.extensions.get('replicas')
+        if target == 'replica' and replicas is not None and not reads_own_writes():
+            g.db_read_engine = replicas.choose()
+        else:
+            g.db_read_engine = None
+    return g.db_read_engine
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica and everything else to the primary.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary.
+    Reads go to a replica when the view allows it (GET and HEAD requests, or
+    views marked with @use_replica) and one is healthy; otherwise, and
+    outside of requests, they go to the primary as well.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info['wrote'] = True
+            else:
+                engine = _read_engine()
+                if engine is not None:
+                    return engine
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        window = current_app.config['DB_READ_YOUR_WRITES_SECONDS']
+        if window:
+            session[PRIMARY_UNTIL] = time.time() + window
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(db_session):
+    db_session.info.pop('wrote', None)
+
+
+class _ReplicaState(object):
+    __slots__ = ('healthy', 'checked_at')
+
+    def __init__(self):
+        self.healthy = False
+        self.checked_at = None
+
+
+class Replicas(object):
+    """Round-robin choice among the read replicas of an app.
+
+    The replicas are the SQLALCHEMY_BINDS named in DB_REPLICA_BINDS. Each
+    one is checked in the background every DB_REPLICA_CHECK_INTERVAL
+    seconds and is skipped while it is unreachable or lags the primary by
+    more than DB_REPLICA_MAX_LAG seconds. With no usable replica, reads fall
+    back to the primary.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DB_REPLICA_BINDS', [])
+        app.config.setdefault('DB_REPLICA_MAX_LAG', 10)
+        app.config.setdefault('DB_REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('DB_READ_YOUR_WRITES_SECONDS', 10)
+        if app.config['DB_REPLICA_BINDS']:
+            app.extensions['replicas'] = _ReplicaSet(self.db, app.config)
+
+
+class _ReplicaSet(object):
+    """The replicas' health, kept current by a background thread.
+
+    Requests only read the last result, so a slow or unreachable replica
+    never holds them up. The thread starts with the first request of each
+    process, since threads do not survive a fork into worker processes;
+    until its first round, reads go to the primary. So do they if a check
+    hangs, once its last result is a few intervals old.
+    """
+
+    def __init__(self, db, config):
+        self.db = db
+        self.config = config
+        self.keys = list(config['DB_REPLICA_BINDS'])
+        self.states = dict((key, _ReplicaState()) for key in self.keys)
+        self.turns = itertools.count()
+        self.lock = threading.Lock()
+        self.checker_pid = None
+
+    def choose(self):
+        """Return the engine of the next usable replica, or None."""
+        self._start_checker()
+        for _ in self.keys:
+            key = self.keys[next(self.turns) % len(self.keys)]
+            if self._usable(self.states[key]):
+                return self.db.engines[key]
+        return None
+
+    def _usable(self, state):
+        if not state.healthy:
+            return False
+        return time.time() - state.checked_at < 3 * self.config['DB_REPLICA_CHECK_INTERVAL']
+
+    def _start_checker(self):
+        if self.checker_pid == os.getpid():
+            return
+        with self.lock:
+            if self.checker_pid != os.getpid():
+                self.checker_pid = os.getpid()
+                engines = [(key, self.db.engines[key]) for key in self.keys]
+                threading.Thread(target=self._run, args=(engines,), name='replica-checks', daemon=True).start()
+
+    def _run(self, engines):
+        while True:
+            for key, engine in engines:
+                self._update(key, self._check(key, engine))
+            time.sleep(self.config['DB_REPLICA_CHECK_INTERVAL'])
+
+    def _update(self, key, healthy):
+        state = self.states[key]
+        if healthy != state.healthy and state.checked_at is not None:
+            logger.warning('Read replica %s is %s', key, 'back in use' if healthy else 'skipped')
+        state.healthy, state.checked_at = healthy, time.time()
+
+    def _check(self, key, engine):
+        # A raw DBAPI connection, outside of any session. New connections
+        # give up after DB_REPLICA_CONNECT_TIMEOUT (see config.py).
+        try:
+            connection = engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute(_PG_LAG if engine.dialect.name == 'postgresql' else 'SELECT 1')
+                lag = cursor.fetchone()[0] if engine.dialect.name == 'postgresql' else 0
+                cursor.close()
+            finally:
+                connection.close()
+        except Exception as e:
+            logger.warning('Read replica %s failed its health check: %s', key, e)
+            return False
+        if lag > self.config['DB_REPLICA_MAX_LAG']:
+            logger.warning('Read replica %s lags the primary by %.1f seconds', key, lag)
+            return False
+        return True
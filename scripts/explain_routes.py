@@ -0,0 +1,91 @@
+"""Run EXPLAIN on the SQL that each route issues.
+
+Every route is requested through the Flask test client, the SELECT statements
+it executes are captured with their parameters, and each one is EXPLAINed
+against the configured database. Run it before and after a migration and diff
+the two outputs:
+
+    python scripts/explain_routes.py > before.txt
+    flask db upgrade
+    python scripts/explain_routes.py > after.txt
+    diff before.txt after.txt
+
+Pass --analyze to use EXPLAIN (ANALYZE, BUFFERS) on Postgres; the statements
+are then actually executed, so keep it to read-only routes (the default).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, Artist, Venue
+
+
+def routes(venue_id, artist_id, search_term):
+    return [
+        ('GET', '/venues', None),
+        ('GET', '/artists', None),
+        ('GET', '/shows', None),
+        ('GET', '/venues/{0}'.format(venue_id), None),
+        ('GET', '/artists/{0}'.format(artist_id), None),
+        ('GET', '/venues/{0}/edit'.format(venue_id), None),
+        ('GET', '/artists/{0}/edit'.format(artist_id), None),
+        ('POST', '/venues/search', {'search_term': search_term}),
+        ('POST', '/artists/search', {'search_term': search_term}),
+    ]
+
+
+def explain_prefix(dialect, analyze):
+    if dialect == 'postgresql':
+        return 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    if dialect == 'sqlite':
+        return 'EXPLAIN QUERY PLAN '
+    return 'EXPLAIN '
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--analyze', action='store_true', help='use EXPLAIN ANALYZE (Postgres only)')
+    parser.add_argument('--search-term', default='a', help='term posted to the search routes')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        prefix = explain_prefix(engine.dialect.name, args.analyze)
+        venue_id = db.session.scalar(db.select(db.func.min(Venue.id))) or 1
+        artist_id = db.session.scalar(db.select(db.func.min(Artist.id))) or 1
+
+    captured = []
+    explaining = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not explaining:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    client = app.test_client()
+    for method, path, form in routes(venue_id, artist_id, args.search_term):
+        del captured[:]
+        response = client.open(path, method=method, data=form)
+        print('=' * 78)
+        print('{0} {1} -> {2}, {3} statements'.format(method, path, response.status_code, len(captured)))
+        explaining.append(True)
+        with engine.connect() as conn:
+            for statement, parameters in list(captured):
+                print('-' * 78)
+                print(statement.strip())
+                print()
+                for row in conn.exec_driver_sql(prefix + statement, parameters):
+                    print('    ' + ' | '.join(str(column) for column in row))
+            conn.rollback()
+        explaining.pop()
+    event.remove(engine, 'before_cursor_execute', capture)
+
+
+if __name__ == '__main__':
+    main()
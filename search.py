@@ -0,0 +1,215 @@
+import re
+
+from sqlalchemy import column, event, func, text
+
+from models import db, Artist, Venue
+
+SEARCHABLE = (Venue, Artist)
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _results(rows):
+    rows = list(rows)
+    return {
+        "count": rows[0].total if rows else 0,
+        "data": [
+            {
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.upcoming_shows_count
+            }
+            for row in rows
+        ]
+    }
+
+
+class LikeSearch(object):
+    """Fallback backend: a case-insensitive substring match on the name."""
+
+    def search(self, session, model, term, limit):
+        pattern = '%{}%'.format(_escape_like(term))
+        rows = session.execute(
+            db.select(
+                model.id,
+                model.name,
+                model.upcoming_shows_count,
+                func.count().over().label('total')
+            )
+            .where(model.name.ilike(pattern, escape='\\'))
+            .order_by(model.name, model.id)
+            .limit(limit)
+        )
+        return _results(rows)
+
+
+class PostgresSearch(LikeSearch):
+    """Ranked search over the `search_vector` tsvector column.
+
+    The column is maintained by a trigger and covers name, city, state and
+    genres (see migrations 5b8e1f0c7a92 and e3a91c5d7b24). Word matches are ranked with
+    ts_rank, and partial name matches are picked up by the pg_trgm index on
+    name and ranked by their similarity to the search term.
+    """
+
+    def search(self, session, model, term, limit):
+        if not _TOKEN.search(term):
+            return super(PostgresSearch, self).search(session, model, term, limit)
+
+        vector = column('search_vector')
+        query = func.websearch_to_tsquery('simple', term)
+        pattern = '%{}%'.format(_escape_like(term))
+        rank = func.ts_rank(vector, query) + func.similarity(model.name, term)
+        rows = session.execute(
+            db.select(
+                model.id,
+                model.name,
+                model.upcoming_shows_count,
+                func.count().over().label('total')
+            )
+            .where(vector.op('@@')(query) | model.name.ilike(pattern, escape='\\'))
+            .order_by(rank.desc(), model.name, model.id)
+            .limit(limit)
+        )
+        return _results(rows)
+
+
+class SqliteSearch(LikeSearch):
+    """FTS5 backend so search can be exercised locally without Postgres.
+
+    Each searchable model gets a `<table>_fts` virtual table keyed by the
+    entity id, created on first use and kept in sync by the mapper events at
+    the bottom of this module. Terms match as word prefixes, ranked by bm25.
+    """
+
+    # bm25() weights of the FTS columns (name, city, state, genres): the
+    # name counts most, then the city and state, then the genres, as the A,
+    # B and C weights do on Postgres.
+    WEIGHTS = (10.0, 3.0, 3.0, 1.0)
+
+    @staticmethod
+    def fts_table(model):
+        return '{0}_fts'.format(model.__tablename__)
+
+    @staticmethod
+    def document(target):
+        return {
+            'rowid': target.id,
+            'name': target.name or '',
+            'city': target.city or '',
+            'state': target.state or '',
+            'genres': ' '.join(target.genres or [])
+        }
+
+    def ensure_schema(self, connection, model):
+        table = self.fts_table(model)
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': table}
+        ).first()
+        if exists:
+            return
+        connection.execute(text(
+            'CREATE VIRTUAL TABLE "{0}" USING fts5(name, city, state, genres)'.format(table)
+        ))
+        rows = connection.execute(db.select(model.id, model.name, model.city, model.state, model.genres))
+        documents = [self.document(row) for row in rows]
+        if documents:
+            connection.execute(self._insert(table), documents)
+
+    @staticmethod
+    def _insert(table):
+        return text(
+            'INSERT INTO "{0}" (rowid, name, city, state, genres) '
+            'VALUES (:rowid, :name, :city, :state, :genres)'.format(table)
+        )
+
+    def index(self, connection, model, target):
+        self.ensure_schema(connection, model)
+        self.unindex(connection, model, target)
+        connection.execute(self._insert(self.fts_table(model)), self.document(target))
+
+    def unindex(self, connection, model, target):
+        self.ensure_schema(connection, model)
+        connection.execute(
+            text('DELETE FROM "{0}" WHERE rowid = :rowid'.format(self.fts_table(model))),
+            {'rowid': target.id}
+        )
+
+    def search(self, session, model, term, limit):
+        tokens = _TOKEN.findall(term)
+        if not tokens:
+            return super(SqliteSearch, self).search(session, model, term, limit)
+
+        # Searches never commit, so the table is built in a transaction of
+        # its own; in the request's it would be rolled back with it.
+        with session.get_bind().begin() as connection:
+            self.ensure_schema(connection, model)
+        table = self.fts_table(model)
+        match = ' '.join('"{0}"*'.format(token) for token in tokens)
+        rows = session.execute(
+            text(
+                'SELECT e.id, e.name, e.upcoming_shows_count, count(*) OVER () AS total '
+                'FROM (SELECT rowid, bm25("{fts}", {weights}) AS rank FROM "{fts}" WHERE "{fts}" MATCH :match) m '
+                'JOIN "{table}" e ON e.id = m.rowid '
+                'ORDER BY m.rank, e.name, e.id '
+                'LIMIT :limit'.format(
+                    fts=table, table=model.__tablename__, weights=', '.join(str(weight) for weight in self.WEIGHTS)
+                )
+            ),
+            {'match': match, 'limit': limit}
+        )
+        return _results(rows)
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch(),
+    'sqlite': SqliteSearch(),
+}
+
+
+def backend_for(dialect_name):
+    return BACKENDS.get(dialect_name, LikeSearch())
+
+
+def search(model, term, limit):
+    """Return the top `limit` matches for `term` and the total match count.
+
+    The result has the shape the search templates expect:
+    {"count": <total matches>, "data": [{id, name, num_upcoming_shows}, ...]}.
+    """
+    session = db.session
+    dialect = session.get_bind().dialect.name
+    return backend_for(dialect).search(session, model, term.strip(), limit)
+
+
+#----------------------------------------------------------------------------#
+# SQLite index maintenance.
+#----------------------------------------------------------------------------#
+
+def _sync_index(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        BACKENDS['sqlite'].index(connection, mapper.class_, target)
+
+def _drop_from_index(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        BACKENDS['sqlite'].unindex(connection, mapper.class_, target)
+
+def reindex(connection, model):
+    """Bring the search index of `model` up to date after rows were written
+    around the ORM, e.g. by the bulk importer.
+
+    Postgres keeps search_vector current with a trigger, so only the SQLite
+    FTS table needs it: it is dropped and rebuilt by the next search.
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DROP TABLE IF EXISTS "{0}"'.format(SqliteSearch.fts_table(model))))
+
+for _model in SEARCHABLE:
+    event.listen(_model, 'after_insert', _sync_index)
+    event.listen(_model, 'after_update', _sync_index)
+    event.listen(_model, 'after_delete', _drop_from_index)
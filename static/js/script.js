@@ -2,3 +2,37 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Search-as-you-type: fill the search box's datalist from /api/typeahead.
+document.addEventListener('DOMContentLoaded', function () {
+  var inputs = document.querySelectorAll('input[data-typeahead]');
+  Array.prototype.forEach.call(inputs, function (input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var q = input.value.trim();
+        if (!q) {
+          list.innerHTML = '';
+          return;
+        }
+        var url = '/api/typeahead?kind=' + encodeURIComponent(input.dataset.typeahead) +
+          '&q=' + encodeURIComponent(q);
+        fetch(url)
+          .then(function (response) { return response.json(); })
+          .then(function (data) {
+            list.innerHTML = '';
+            data.results.forEach(function (result) {
+              var option = document.createElement('option');
+              option.value = result.name;
+              list.appendChild(option);
+            });
+          })
+          .catch(function (e) {
+            console.error(e);
+          });
+      }, 150);
+    });
+  });
+});
@@ -0,0 +1,211 @@
+import atexit
+from datetime import datetime, timezone
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import math
+import queue
+import time
+
+from flask import before_render_template, has_request_context, request, signals_available, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# WSGI environ key of the current request's measurements.
+ENVIRON_KEY = 'fyyur.telemetry'
+
+logger = logging.getLogger('fyyur.telemetry')
+logger.propagate = False
+
+
+def queued(handler):
+    """Wrap `handler` so that records are written by a background thread.
+
+    The returned QueueHandler only puts records on an unbounded queue, so
+    logging never waits on the disk; the listener thread drains the queue
+    into `handler` and is stopped, flushing what is left, at exit.
+    """
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return QueueHandler(records)
+
+
+def _stats():
+    if has_request_context():
+        return request.environ.get(ENVIRON_KEY)
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _stats() is not None:
+        context.telemetry_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'telemetry_started', None)
+    stats = _stats()
+    if started is not None and stats is not None:
+        stats['sql_count'] += 1
+        stats['sql_ms'] += (time.perf_counter() - started) * 1000
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats['_render_started'] = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and '_render_started' in stats:
+        stats['template_ms'] = (stats['template_ms'] or 0) + (
+            time.perf_counter() - stats.pop('_render_started')
+        ) * 1000
+
+
+class _Body(object):
+    """Response iterable that counts the bytes sent and logs the request's
+    record once the server closes it, so streamed bodies are included."""
+
+    def __init__(self, body, stats, started):
+        self.body = body
+        self.stats = stats
+        self.started = started
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.stats['bytes'] += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.stats['ms'] = (time.perf_counter() - self.started) * 1000
+            self.stats.pop('_render_started', None)
+            for key in ('ms', 'sql_ms', 'template_ms'):
+                if self.stats[key] is not None:
+                    self.stats[key] = round(self.stats[key], 2)
+            logger.info(json.dumps(self.stats, separators=(',', ':')))
+
+
+class Telemetry(object):
+    """Log one JSON line per request to TELEMETRY_LOG.
+
+    Each record has the route, status, total latency (until the last byte
+    of the body is sent), the number and time of SQL statements, template
+    render time and response size. Records go through a queue to a rotating
+    file, written by a background thread. `flask fyyur telemetry-report`
+    summarizes them.
+    """
+
+    def __init__(self, app=None):
+        self.handler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TELEMETRY_ENABLED', True)
+        app.config.setdefault('TELEMETRY_LOG', 'telemetry.log')
+        app.config.setdefault('TELEMETRY_LOG_MAX_BYTES', 10 * 1024 * 1024)
+        app.config.setdefault('TELEMETRY_LOG_BACKUPS', 5)
+        if not app.config['TELEMETRY_ENABLED']:
+            return
+
+        if self.handler is None:
+            file_handler = RotatingFileHandler(
+                app.config['TELEMETRY_LOG'],
+                maxBytes=app.config['TELEMETRY_LOG_MAX_BYTES'],
+                backupCount=app.config['TELEMETRY_LOG_BACKUPS'],
+                delay=True
+            )
+            self.handler = queued(file_handler)
+            logger.addHandler(self.handler)
+            logger.setLevel(logging.INFO)
+        if signals_available:
+            before_render_template.connect(_before_render, app)
+            template_rendered.connect(_rendered, app)
+
+        app.before_request(self._route)
+        app.wsgi_app = self._middleware(app.wsgi_app)
+
+    @staticmethod
+    def _route():
+        stats = request.environ.get(ENVIRON_KEY)
+        if stats is not None and request.url_rule is not None:
+            stats['route'] = request.url_rule.rule
+
+    @staticmethod
+    def _middleware(wsgi_app):
+        def middleware(environ, start_response):
+            started = time.perf_counter()
+            stats = environ[ENVIRON_KEY] = {
+                'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                'method': environ.get('REQUEST_METHOD'),
+                'route': None,
+                'status': None,
+                'ms': None,
+                'sql_count': 0,
+                'sql_ms': 0.0,
+                'template_ms': 0.0 if signals_available else None,
+                'bytes': 0,
+            }
+
+            def start(status, headers, exc_info=None):
+                stats['status'] = int(status.split(' ', 1)[0])
+                return start_response(status, headers, exc_info)
+
+            return _Body(wsgi_app(environ, start), stats, started)
+        return middleware
+
+
+#----------------------------------------------------------------------------#
+# Report.
+#----------------------------------------------------------------------------#
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def read_records(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(records):
+    """Group records by (method, route) and return one row of latency
+    percentiles and averages per group, slowest p95 first."""
+    groups = {}
+    for record in records:
+        groups.setdefault((record['method'], record['route'] or '<unmatched>'), []).append(record)
+    rows = []
+    for (method, route), group in groups.items():
+        latencies = sorted(record['ms'] for record in group)
+        rows.append({
+            'method': method,
+            'route': route,
+            'count': len(group),
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'sql_count': sum(record['sql_count'] for record in group) / float(len(group)),
+            'sql_ms': sum(record['sql_ms'] for record in group) / float(len(group)),
+            'template_ms': sum(record['template_ms'] or 0 for record in group) / float(len(group)),
+            'bytes': sum(record['bytes'] for record in group) / float(len(group)),
+            'errors': sum(1 for record in group if (record['status'] or 500) >= 500),
+        })
+    rows.sort(key=lambda row: row['p95'], reverse=True)
+    return rows
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+import config
+from app import create_app
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on a fresh SQLite database, without replicas or page cache.
+
+    With TEST_DATABASE_URL set, the tests run against that database instead
+    (e.g. Postgres, to cover COPY), and its tables are dropped afterwards.
+    """
+    url = os.getenv('TEST_DATABASE_URL') or 'sqlite:///{0}'.format(tmp_path / 'fyyur.db')
+    settings = dict((name, getattr(config, name)) for name in dir(config) if name.isupper())
+    settings.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=url,
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        SQLALCHEMY_BINDS={},
+        DB_REPLICA_BINDS=[],
+        PAGE_CACHE_ENABLED=False,
+        TELEMETRY_LOG=str(tmp_path / 'telemetry.log'),
+    )
+    app = create_app(type('TestConfig', (object,), settings))
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        if os.getenv('TEST_DATABASE_URL'):
+            db.drop_all()
+        db.engine.dispose()
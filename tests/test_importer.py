@@ -0,0 +1,52 @@
+import pytest
+
+from importer import create_show_batch, run_import, supports_copy
+from models import db, Artist, Venue
+
+HEADER = 'id,name,city,state,address,phone,genres,facebook_link,image_link,website_link,seeking_talent,seeking_description\n'
+
+
+@pytest.mark.parametrize('method', ['executemany', 'copy'])
+def test_import_loads_a_batch_mixing_rows_with_and_without_ids(app, tmp_path, method):
+    with app.app_context():
+        if method == 'copy' and not supports_copy(db.session.connection()):
+            pytest.skip('COPY needs Postgres with psycopg2 (set TEST_DATABASE_URL)')
+    path = tmp_path / 'venues.csv'
+    path.write_text(
+        HEADER
+        + '41,Kept Id,San Francisco,CA,1 Main St,415-555-1234,Jazz,http://fb.com/kept,,,True,\n'
+        + ',New Id,New York,NY,2 Main St,212-555-0000,Blues,http://fb.com/new,,,False,\n'
+        + '42,Also Kept,San Francisco,CA,3 Main St,415-555-4321,Folk,http://fb.com/also,,,False,\n'
+    )
+
+    with app.app_context():
+        # One batch, so both kinds of rows are loaded in one transaction.
+        totals = run_import('venues', str(path), method=method, batch_size=10, report=lambda message: None)
+        ids = dict(db.session.execute(db.select(Venue.name, Venue.id)).all())
+
+    assert totals['inserted'] == 3
+    assert totals['rejected'] == 0
+    assert ids['Kept Id'] == 41
+    assert ids['Also Kept'] == 42
+    assert ids['New Id'] not in (41, 42)
+
+
+def test_show_batch_reports_every_error_of_an_item(app):
+    with app.app_context():
+        db.session.add(Venue(id=1, name='Blue Note', city='New York', state='NY', genres=['Jazz']))
+        db.session.add(Artist(id=1, name='Miles', city='New York', state='NY', genres=['Jazz']))
+        db.session.commit()
+        results, created = create_show_batch([
+            {'artist_id': 'x', 'venue_id': '1'},
+            {'artist_id': '1', 'venue_id': '7'},
+            {'artist_id': '1', 'venue_id': '1', 'start_time': '2030-01-01 20:00:00'},
+        ])
+
+    assert results[0] == {'status': 'invalid', 'errors': {
+        'artist_id': ['Not a valid id.'], 'start_time': ['This field is required.'],
+    }}
+    assert results[1] == {'status': 'invalid', 'errors': {
+        'venue_id': ['No venue with this id.'], 'start_time': ['This field is required.'],
+    }}
+    assert results[2] == {'status': 'created'}
+    assert len(created) == 1
@@ -0,0 +1,18 @@
+from models import db, Venue
+
+
+def test_all_venues_link_only_on_the_area_landing(app):
+    app.config['AREA_VENUES_LIMIT'] = 1
+    with app.app_context():
+        db.session.add_all([
+            Venue(name='Blue Note', city='New York', state='NY', genres=['Jazz']),
+            Venue(name='Village Vanguard', city='New York', state='NY', genres=['Jazz']),
+            Venue(name='Bowery Ballroom', city='New York', state='NY', genres=['Folk']),
+        ])
+        db.session.commit()
+    client = app.test_client()
+
+    assert b'All 3 venues in New York' in client.get('/venues').data
+    filtered = client.get('/venues?genre=Jazz').data
+    assert b'Village Vanguard' in filtered
+    assert b'All 3 venues' not in filtered
@@ -0,0 +1,28 @@
+from models import db, Venue
+from pagecache import page_cache
+
+
+def test_cached_page_follows_writes_made_by_other_workers(app):
+    app.config['PAGE_CACHE_ENABLED'] = True
+    page_cache.clear()
+    with app.app_context():
+        venue = Venue(name='Blue Note', city='New York', state='NY', genres=['Jazz'])
+        db.session.add(venue)
+        db.session.commit()
+        venue_id = venue.id
+    client = app.test_client()
+    path = '/venues/{0}'.format(venue_id)
+
+    assert client.get(path).headers['X-Cache'] == 'MISS'
+    cached = client.get(path)
+    assert cached.headers['X-Cache'] == 'HIT'
+
+    # As if another worker renamed it: this one's cache is not invalidated.
+    with app.app_context():
+        db.session.get(Venue, venue_id).name = 'Green Mill'
+        db.session.commit()
+
+    response = client.get(path, headers={'If-None-Match': cached.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != cached.headers['ETag']
+    assert b'Green Mill' in response.data
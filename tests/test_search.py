@@ -0,0 +1,24 @@
+from models import db, Venue
+from search import reindex, search
+
+
+def test_sqlite_search_index_outlives_the_request_that_builds_it(app):
+    with app.app_context():
+        db.session.add_all([
+            Venue(name='Blue Note', city='New York', state='NY', genres=['Jazz']),
+            Venue(name='Blue Moon', city='Boston', state='MA', genres=['Blues']),
+            Venue(name='Red Room', city='Blue Springs', state='MO', genres=['Folk']),
+            Venue(name='Green Mill', city='Chicago', state='IL', genres=['Jazz']),
+        ])
+        db.session.commit()
+        # As after a bulk import: the next search rebuilds the index.
+        reindex(db.session.connection(), Venue)
+        db.session.commit()
+
+    hits = []
+    for _ in range(2):
+        # Each search in a request of its own, which ends without a commit.
+        with app.test_request_context('/venues/search', method='POST'):
+            hits.append(sorted(row['name'] for row in search(Venue, 'blue', 20)['data']))
+    assert hits[0] == ['Blue Moon', 'Blue Note', 'Red Room']
+    assert hits[1] == hits[0]
@@ -0,0 +1,223 @@
+from array import array
+from bisect import bisect_left
+import threading
+import time
+
+from models import db, Artist, Venue
+
+KINDS = {
+    'venue': Venue,
+    'artist': Artist,
+}
+
+# Offsets are stored as unsigned shorts; longer names are only indexed on the
+# words that start within the first 64k bytes.
+_MAX_OFFSET = 0xFFFF
+
+
+def _fold(name):
+    """The casefolded, whitespace-normalized name, UTF-8 encoded. Byte order
+    is code point order, so folded names sort and match as bytes."""
+    return ' '.join((name or '').casefold().split()).encode('utf-8')
+
+
+def _word_offsets(folded):
+    offsets = [0]
+    for i, byte in enumerate(folded):
+        if byte == 0x20 and i + 1 <= _MAX_OFFSET:
+            offsets.append(i + 1)
+    return offsets
+
+
+class PrefixIndex(object):
+    """Sorted-array index answering "names with a word starting with q".
+
+    Each name is held in one shared byte buffer, folded and followed by its
+    display form; four typed arrays sorted by id locate it there. Every word start of every name is
+    one entry, kept sorted by the folded name suffix beginning at that word.
+    The entry itself is only an id and an offset held in two more typed
+    arrays, and the suffix is sliced out of the buffer on demand, so memory
+    is a few bytes per word on top of the names. Lookups are a binary search
+    followed by a short scan, and return ids with their display names.
+    Removed names leave their bytes in the buffer until the next load().
+    """
+
+    __slots__ = (
+        '_ids', '_offsets', '_buffer', '_name_ids', '_starts', '_lengths', '_display_lengths', '_lock',
+    )
+
+    def __init__(self):
+        self._ids = array('l')
+        self._offsets = array('H')
+        self._buffer = bytearray()
+        self._name_ids = array('l')
+        self._starts = array('Q')
+        self._lengths = array('L')
+        self._display_lengths = array('L')
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._name_ids)
+
+    def _slot(self, entity_id):
+        position = bisect_left(self._name_ids, entity_id)
+        if position < len(self._name_ids) and self._name_ids[position] == entity_id:
+            return position
+        return None
+
+    def _folded(self, slot):
+        start = self._starts[slot]
+        return bytes(self._buffer[start:start + self._lengths[slot]])
+
+    def _display(self, slot):
+        start = self._starts[slot] + self._lengths[slot]
+        return self._buffer[start:start + self._display_lengths[slot]].decode('utf-8')
+
+    def _key(self, i):
+        slot = self._slot(self._ids[i])
+        start = self._starts[slot] + self._offsets[i]
+        return bytes(self._buffer[start:self._starts[slot] + self._lengths[slot]])
+
+    def _entry(self, i):
+        return (self._key(i), self._ids[i])
+
+    def _bisect(self, entry):
+        lo, hi = 0, len(self._ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid) < entry:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def load(self, rows):
+        """Replace the index contents with `rows` of (id, name)."""
+        buffer, slots, entries = bytearray(), [], []
+        for entity_id, name in rows:
+            key = _fold(name)
+            if not key:
+                continue
+            display = name.encode('utf-8')
+            slots.append((entity_id, len(buffer), len(key), len(display)))
+            buffer += key + display
+            entries.extend((key[offset:], entity_id, offset) for offset in _word_offsets(key))
+        slots.sort()
+        entries.sort()
+        with self._lock:
+            self._buffer = buffer
+            self._name_ids = array('l', (slot[0] for slot in slots))
+            self._starts = array('Q', (slot[1] for slot in slots))
+            self._lengths = array('L', (slot[2] for slot in slots))
+            self._display_lengths = array('L', (slot[3] for slot in slots))
+            self._ids = array('l', (entry[1] for entry in entries))
+            self._offsets = array('H', (entry[2] for entry in entries))
+
+    def add(self, entity_id, name):
+        with self._lock:
+            self.remove(entity_id)
+            key = _fold(name)
+            if not key:
+                return
+            slot = bisect_left(self._name_ids, entity_id)
+            self._name_ids.insert(slot, entity_id)
+            self._starts.insert(slot, len(self._buffer))
+            display = name.encode('utf-8')
+            self._lengths.insert(slot, len(key))
+            self._display_lengths.insert(slot, len(display))
+            self._buffer += key + display
+            for offset in _word_offsets(key):
+                position = self._bisect((key[offset:], entity_id))
+                self._ids.insert(position, entity_id)
+                self._offsets.insert(position, offset)
+
+    def remove(self, entity_id):
+        with self._lock:
+            slot = self._slot(entity_id)
+            if slot is None:
+                return
+            key = self._folded(slot)
+            for offset in reversed(_word_offsets(key)):
+                position = self._bisect((key[offset:], entity_id))
+                del self._ids[position]
+                del self._offsets[position]
+            del self._name_ids[slot]
+            del self._starts[slot]
+            del self._lengths[slot]
+            del self._display_lengths[slot]
+
+    def complete(self, prefix, limit):
+        """Return (id, name) for up to `limit` names with a word starting
+        with `prefix`, in the order of the matching words."""
+        prefix = _fold(prefix)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        with self._lock:
+            position = self._bisect((prefix, -1))
+            while position < len(self._ids) and len(results) < limit:
+                if not self._key(position).startswith(prefix):
+                    break
+                entity_id = self._ids[position]
+                if entity_id not in seen:
+                    seen.add(entity_id)
+                    results.append((entity_id, self._display(self._slot(entity_id))))
+                position += 1
+        return results
+
+
+class Typeahead(object):
+    """Per-process name indexes for venues and artists.
+
+    The indexes are loaded from the database on the first lookup, and
+    reloaded once they are older than TYPEAHEAD_MAX_AGE seconds, which bounds
+    how long writes served by other worker processes go unseen. In between,
+    the create, edit and delete handlers of this process keep them current.
+    Bulk loads call invalidate(), so that the next lookup reloads them.
+    Lookups are answered from the indexes alone, display names included, so
+    they only query the database when the indexes are (re)loaded.
+    """
+
+    def __init__(self):
+        self.indexes = dict((kind, PrefixIndex()) for kind in KINDS)
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        for kind, model in KINDS.items():
+            rows = db.session.execute(db.select(model.id, model.name))
+            self.indexes[kind].load(rows)
+        self._built_at = time.monotonic()
+
+    def build(self):
+        with self._lock:
+            self._load()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    # Before the first build there is nothing to keep current: the build
+    # reads the committed rows. A write racing the build waits for its lock.
+
+    def add(self, kind, entity_id, name):
+        with self._lock:
+            if self._built_at is not None:
+                self.indexes[kind].add(entity_id, name)
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            if self._built_at is not None:
+                self.indexes[kind].remove(entity_id)
+
+    def complete(self, kind, prefix, limit, max_age):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > max_age:
+                self._load()
+        return [
+            {'id': entity_id, 'name': name, 'kind': kind}
+            for entity_id, name in self.indexes[kind].complete(prefix, limit)
+        ]
+
+
+typeahead = Typeahead()